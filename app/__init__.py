@@ -2,6 +2,7 @@ import logging
 import os
 
 import telegram.ext
+import telegram.utils.request
 from flask import Flask
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
@@ -15,12 +16,98 @@ app.config['HEROKU_DOMAIN'] = os.getenv('HEROKU_DOMAIN', None)
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', None)
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 2}
+
+# number of feeds downloaded in parallel and timeout (in seconds) for downloading
+# one feed, it limits every socket read and the whole download time as well
+app.config['FEED_WORKERS'] = int(os.getenv('FEED_WORKERS', 8))
+app.config['FEED_TIMEOUT'] = float(os.getenv('FEED_TIMEOUT', 30))
+app.config['FEED_CONNECT_TIMEOUT'] = float(os.getenv('FEED_CONNECT_TIMEOUT', 5))
+# failed downloads are retried with exponential backoff, base delay is in seconds
+app.config['FEED_RETRIES'] = int(os.getenv('FEED_RETRIES', 2))
+app.config['FEED_BACKOFF'] = float(os.getenv('FEED_BACKOFF', 1))
+# one feed is fetched for every category and vacancies are assigned to cities
+# by their location, otherwise feed of every subscribed city is fetched
+app.config['FEED_COALESCE'] = os.getenv('FEED_COALESCE', 'true').lower() == 'true'
+# feeds are checked every tick and polled with the interval adapted to rate
+# of new vacancies and number of subscribers, all values are in minutes
+app.config['FEED_TICK'] = float(os.getenv('FEED_TICK', 1))
+app.config['FEED_MIN_INTERVAL'] = float(os.getenv('FEED_MIN_INTERVAL', 2))
+app.config['FEED_MAX_INTERVAL'] = float(os.getenv('FEED_MAX_INTERVAL', 120))
+# intervals (in minutes) of dispatching new vacancies to chats and sending
+# them, stages are run independently and hand off work through the database
+app.config['DISPATCH_INTERVAL'] = float(os.getenv('DISPATCH_INTERVAL', 1))
+app.config['BROADCAST_INTERVAL'] = float(os.getenv('BROADCAST_INTERVAL', 1))
+# host is requested with given interval (in minutes) to prevent sleeping of
+# free dyno, zero disables requests
+app.config['KEEP_ALIVE_INTERVAL'] = float(os.getenv('KEEP_ALIVE_INTERVAL', 5))
+# flags of chats and greeting, that are checked on every update, are cached
+# for given number of seconds
+app.config['CHAT_CACHE_SIZE'] = int(os.getenv('CHAT_CACHE_SIZE', 10000))
+app.config['CHAT_CACHE_TTL'] = float(os.getenv('CHAT_CACHE_TTL', 300))
+# old rows are deleted with given interval (in minutes) by batches of given
+# size. Horizons are in days, zero keeps rows forever. Vacancies of the last
+# day are dispatched to chats, so horizons of vacancies and their rows of
+# chats should be longer than one day. Dynos are restarted about daily, so the
+# first run is delayed by given minutes after start instead of whole interval
+app.config['RETENTION_INTERVAL'] = float(os.getenv('RETENTION_INTERVAL', 24 * 60))
+app.config['RETENTION_DELAY'] = float(os.getenv('RETENTION_DELAY', 10))
+app.config['RETENTION_BATCH_SIZE'] = int(os.getenv('RETENTION_BATCH_SIZE', 1000))
+app.config['RETENTION_VACANCY_DAYS'] = int(os.getenv('RETENTION_VACANCY_DAYS', 30))
+app.config['RETENTION_VACANCY_CHAT_DAYS'] = int(os.getenv('RETENTION_VACANCY_CHAT_DAYS', 7))
+app.config['RETENTION_POST_CHAT_DAYS'] = int(os.getenv('RETENTION_POST_CHAT_DAYS', 30))
+app.config['RETENTION_STAT_DAYS'] = int(os.getenv('RETENTION_STAT_DAYS', 365))
+
+# messages are sent by pool of workers within Telegram limits: messages per
+# second for the bot, seconds between messages to the same chat and number of
+# retries after flood control error
+app.config['SEND_WORKERS'] = int(os.getenv('SEND_WORKERS', 8))
+app.config['SEND_RATE'] = float(os.getenv('SEND_RATE', 30))
+app.config['SEND_CHAT_INTERVAL'] = float(os.getenv('SEND_CHAT_INTERVAL', 1))
+app.config['SEND_RETRIES'] = int(os.getenv('SEND_RETRIES', 3))
+# results of sending are saved by batches of given size or after given seconds
+app.config['SEND_FLUSH_SIZE'] = int(os.getenv('SEND_FLUSH_SIZE', 100))
+app.config['SEND_FLUSH_INTERVAL'] = float(os.getenv('SEND_FLUSH_INTERVAL', 5))
+# messages are claimed by batches for given number of seconds, so several
+# processes can send them in parallel
+app.config['SEND_BATCH_SIZE'] = int(os.getenv('SEND_BATCH_SIZE', 500))
+app.config['SEND_LEASE'] = float(os.getenv('SEND_LEASE', 300))
+# claimed messages are read from server-side cursor by chunks of given size and
+# new vacancies are dispatched to chats by batches of given size
+app.config['SEND_FETCH_SIZE'] = int(os.getenv('SEND_FETCH_SIZE', 100))
+app.config['DISPATCH_BATCH_SIZE'] = int(os.getenv('DISPATCH_BATCH_SIZE', 200))
+# failed messages are retried with exponential backoff (in seconds) until
+# number of attempts is exhausted
+app.config['SEND_MAX_ATTEMPTS'] = int(os.getenv('SEND_MAX_ATTEMPTS', 10))
+app.config['SEND_BACKOFF'] = float(os.getenv('SEND_BACKOFF', 60))
+app.config['SEND_MAX_BACKOFF'] = float(os.getenv('SEND_MAX_BACKOFF', 24 * 60 * 60))
+
+# updates are handled one by one in the dispatcher thread, dispatcher workers
+# only run handlers decorated with `run_async`, which are not used by the bot.
+# Database is used by the dispatcher thread, thread of every pipeline stage
+# (see `cron.STAGES`) and thread of every post that is being sent, so pool has
+# a connection for each of them. Waits for connection longer than given seconds
+# are logged
+app.config['DISPATCHER_WORKERS'] = int(os.getenv('DISPATCHER_WORKERS', 4))
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 8))
+app.config['POOL_WAIT_WARNING'] = float(os.getenv('POOL_WAIT_WARNING', 0.5))
+
+from app.pool import TimedQueuePool
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'poolclass': TimedQueuePool,
+    'pool_size': app.config['DB_POOL_SIZE'],
+}
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
-bot = telegram.Bot(token=app.config['TELEGRAM_TOKEN'])
-updater = telegram.ext.Updater(bot=bot, use_context=True)
+# connection for every sending worker, dispatcher workers, updater and job queue
+bot = telegram.Bot(
+    token=app.config['TELEGRAM_TOKEN'],
+    request=telegram.utils.request.Request(
+        con_pool_size=app.config['SEND_WORKERS'] + app.config['DISPATCHER_WORKERS'] + 4,
+    ),
+)
+updater = telegram.ext.Updater(bot=bot, use_context=True, workers=app.config['DISPATCHER_WORKERS'])
 
 from app import views
 from app import models
@@ -4,6 +4,7 @@ MENU = """
  - /list - перелік підписок
  - /add - додати нову позицію
  - /unsubscribe - відписатися від усіх сповіщень
+ - /digest - отримувати вакансії одним повідомленням або окремо
  - /help - потребую допомоги
 """
 
@@ -17,9 +18,12 @@ ADMIN_MENU = """
  - /stat - отримати посилання для статистики
  - /greeting - змінити привітання для бота
  - /unsubscribe - відписатися від усіх сповіщень
+ - /digest - отримувати вакансії одним повідомленням або окремо
  - /help - потребую допомоги
 """
 
+DIGEST_HEADER = "*Нові вакансії*\n\n"
+
 DEFAULT_GREETING = "Привіт я телеграм бот який буде шукати роботу за тебе"
 
 PAGINATION_SIZE = 5
@@ -28,3 +32,5 @@ HOST = 'https://dou-jobs-telegram-bot.herokuapp.com'
 
 
 DEFAULT_GROUP = 1000
+# the last group, session of the update is removed after all handlers
+SESSION_GROUP = DEFAULT_GROUP + 1
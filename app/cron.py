@@ -1,23 +1,78 @@
+import threading
 from datetime import timedelta
+from typing import Callable
 
 import requests
 
-from app import parser, sender, db, updater
+from app import parser, sender, retention, updater, app
 from app.contants import HOST
+from app.handlers.admin import start_broadcast
+from app.models import Post
+from app.utils import with_session
 
+KEEP_ALIVE_TIMEOUT = 10
+
+
+class Stage:
+    """
+    Scheduled job that runs function in its own thread, so slow stage doesn't
+    delay other jobs of the job queue. Run is skipped while the previous one is
+    not finished yet
+    """
+
+    def __init__(self, name: str, func: Callable[[], None]):
+        self.name = name
+        self.func = func
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        if not self.lock.acquire(blocking=False):
+            app.logger.info(f'Stage {self.name} is still running, skip')
+            return
+        threading.Thread(target=self.run, name=self.name, daemon=True).start()
+
+    @with_session
+    def run(self):
+        try:
+            self.func()
+        except Exception as error:
+            app.logger.exception(msg=f'Error on stage {self.name}', exc_info=error)
+        finally:
+            self.lock.release()
 
-def configure_scheduler():
-    updater.job_queue.run_repeating(
-        callback=get_new_posts,
-        interval=timedelta(minutes=5),
-    )
 
+def keep_alive():
+    # trigger host for preventing sleeping, can be safety disabled on production.
+    requests.get(HOST, timeout=KEEP_ALIVE_TIMEOUT)
+
+
+# stage, its interval and delay of the first run (whole interval when omitted)
+STAGES = (
+    (Stage('fetch', parser.get_new_vacancies), 'FEED_TICK', None),
+    (Stage('dispatch', sender.dispatch_vacancies), 'DISPATCH_INTERVAL', None),
+    (Stage('broadcast', sender.broadcast_vacancies), 'BROADCAST_INTERVAL', None),
+    (Stage('keep_alive', keep_alive), 'KEEP_ALIVE_INTERVAL', None),
+    (Stage('retention', retention.delete_old_rows), 'RETENTION_INTERVAL', 'RETENTION_DELAY'),
+)
+
+
+def configure_scheduler():
+    for stage, interval, delay in STAGES:
+        minutes = app.config[interval]
+        if minutes <= 0:
+            continue
+        updater.job_queue.run_repeating(
+            callback=stage,
+            interval=timedelta(minutes=minutes),
+            first=timedelta(minutes=app.config[delay]) if delay else None,
+            name=stage.name,
+        )
+    resume_posts()
 
-def get_new_posts(*args, **kwargs):
-    # trigger host for preventing sleeping, can be safety removed on production.
-    requests.get(HOST)
 
-    parser.get_new_vacancies()
-    sender.dispatch_vacancies()
-    sender.broadcast_vacancies()
-    db.session.close()
+@with_session
+def resume_posts():
+    """ Continue sending of posts that were published before restart """
+    posts = Post.query.filter(Post.date_published.isnot(None), Post.date_sent.is_(None)).all()
+    for post in posts:
+        start_broadcast(post.id)
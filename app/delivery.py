@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Iterable, Iterator, List, NamedTuple, Optional
+
+from telegram.error import RetryAfter, Unauthorized, BadRequest, ChatMigrated
+
+from app import app
+from app.utils import LRUCache
+
+
+class Delivery(NamedTuple):
+    # identifier of delivery for the caller, e.g. id of VacancyChat
+    key: Hashable
+    chat_id: int
+    # function that sends the message, it's called from worker thread
+    send: Callable[[], Any]
+
+
+class Result(NamedTuple):
+    key: Hashable
+    chat_id: int
+    error: Optional[Exception] = None
+
+    @property
+    def is_sent(self) -> bool:
+        return self.error is None
+
+    @property
+    def is_permanent_error(self) -> bool:
+        """ Errors that will be repeated on the next attempt: blocked bot, missing chat or bad message """
+        return isinstance(self.error, (Unauthorized, BadRequest))
+
+    @property
+    def is_chat_unavailable(self) -> bool:
+        """ Bot is blocked by user, user is deactivated or chat is deleted """
+        return isinstance(self.error, Unauthorized) or (
+            isinstance(self.error, BadRequest) and 'chat not found' in self.error.message.lower()
+        )
+
+    @property
+    def new_chat_id(self) -> Optional[int]:
+        """ Id of supergroup, when group chat was migrated """
+        return self.error.new_chat_id if isinstance(self.error, ChatMigrated) else None
+
+
+class TokenBucket:
+    """ Thread-safe limiter that allows `rate` actions per second with bursts up to `capacity` """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """ Take a token and return time to wait before using it """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """ Don't give tokens for some time, e.g. after flood control error """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# limits of Telegram: about 30 messages per second for the bot
+# and one message per second for the same chat
+BUCKET = TokenBucket(rate=app.config['SEND_RATE'])
+LAST_SENT = LRUCache(size=10000)
+
+
+def wait_for_chat(chat_id: int) -> None:
+    last_sent = LAST_SENT.get(chat_id)
+    if last_sent is not None:
+        wait = last_sent + app.config['SEND_CHAT_INTERVAL'] - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+
+def send(delivery: Delivery) -> Result:
+    """ Send message within rate limits, flood control errors are retried after requested delay """
+    for attempt in range(app.config['SEND_RETRIES'] + 1):
+        wait_for_chat(delivery.chat_id)
+        BUCKET.acquire()
+        try:
+            delivery.send()
+            return Result(key=delivery.key, chat_id=delivery.chat_id)
+        except RetryAfter as error:
+            app.logger.warning(f'Flood control, retry in {error.retry_after} seconds')
+            BUCKET.pause(error.retry_after)
+            if attempt == app.config['SEND_RETRIES']:
+                return Result(key=delivery.key, chat_id=delivery.chat_id, error=error)
+        except Exception as error:
+            return Result(key=delivery.key, chat_id=delivery.chat_id, error=error)
+        finally:
+            LAST_SENT.set(delivery.chat_id, time.monotonic())
+
+
+def send_chat(deliveries: List[Delivery], results: queue.Queue) -> None:
+    for delivery in deliveries:
+        results.put(send(delivery))
+
+
+def deliver(deliveries: Iterable[Delivery]) -> Iterator[Result]:
+    """
+    Send messages by pool of workers and yield results as they are done.
+    Messages of one chat are sent by one worker in the given order, results
+    are handled in the calling thread, so it can use database session
+    """
+    chats = OrderedDict()
+    for delivery in deliveries:
+        chats.setdefault(delivery.chat_id, []).append(delivery)
+
+    total = sum(len(items) for items in chats.values())
+    if not total:
+        return
+
+    results = queue.Queue()
+    with ThreadPoolExecutor(max_workers=app.config['SEND_WORKERS']) as executor:
+        for items in chats.values():
+            executor.submit(send_chat, items, results)
+        for _ in range(total):
+            yield results.get()
@@ -26,6 +26,7 @@ class Menu(Enum):
     add = 'Підписатися ➕'
     help = 'Допомога 🙋'
     unsubscribe = 'Відписатися 🔴'
+    digest = 'Дайджест 📰'
 
     greeting = 'Змінити привітання 👋'
     stat = 'Статистика 📈'
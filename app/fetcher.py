@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+from typing import Dict, Mapping, NamedTuple, Optional
+
+import feedparser
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import app
+
+CHUNK_SIZE = 64 * 1024
+
+# responses with these statuses are requested again, other errors are raised at once
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class Download(NamedTuple):
+    status: int
+    content: bytes
+    headers: Mapping[str, str]
+
+
+def get_session() -> requests.Session:
+    """
+    Shared session with keep-alive connection pool, one connection per feed
+    worker, so connections to DOU are reused between feeds and polls
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config['FEED_WORKERS'])
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'User-Agent': feedparser.USER_AGENT,
+                'Accept-Encoding': 'gzip, deflate',
+            })
+            _session = session
+        return _session
+
+
+def get_backoff(attempt: int) -> float:
+    """ Exponential delay before the next attempt with full jitter """
+    return random.uniform(0, app.config['FEED_BACKOFF'] * 2 ** attempt)
+
+
+def read_content(response: requests.Response, deadline: float) -> bytes:
+    """
+    Read (and decompress) response body chunk by chunk and give up when deadline
+    is passed, so a server that sends data slowly can't hold worker forever
+    """
+    chunks = []
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Feed was not downloaded in time: {response.url}')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def request(url: str, headers: Optional[Dict[str, str]] = None) -> Download:
+    timeout = app.config['FEED_TIMEOUT']
+    deadline = time.monotonic() + timeout
+    response = get_session().get(
+        url=url,
+        headers=headers,
+        timeout=(app.config['FEED_CONNECT_TIMEOUT'], timeout),
+        stream=True,
+    )
+    with response:
+        response.raise_for_status()
+        content = read_content(response, deadline) if response.status_code != 304 else b''
+        return Download(status=response.status_code, content=content, headers=response.headers)
+
+
+def download(url: str, headers: Optional[Dict[str, str]] = None) -> Download:
+    """
+    Download url with shared session, safe for calling from worker threads.
+    Connection errors, timeouts and server errors are retried a few times
+    """
+    retries = app.config['FEED_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            return request(url, headers)
+        except requests.HTTPError as error:
+            if error.response.status_code not in RETRY_STATUSES or attempt == retries:
+                raise
+            app.logger.warning(f'Feed {url} responded with {error.response.status_code}, retry')
+        except (requests.ConnectionError, requests.Timeout, TimeoutError) as error:
+            if attempt == retries:
+                raise
+            app.logger.warning(f'Feed {url} was not downloaded, retry: {error}')
+        time.sleep(get_backoff(attempt))
@@ -1,7 +1,8 @@
 import functools
+import threading
 from typing import Callable, Any
 
-from telegram import Update, Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
+from telegram import Update, Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, TelegramError
 from telegram.ext import (
     Dispatcher,
     ConversationHandler,
@@ -15,9 +16,10 @@ from telegram.ext import (
 from app import db, bot, app
 from app.contants import DEFAULT_GREETING, HOST, DEFAULT_GROUP
 from app.enum import Menu
-from app.models import Greeting, Post, City, Position, Subscription, utc_now, UserChat
+from app.models import Greeting, Post, utc_now, PostChat
+from app.sender import enqueue_post, send_post_batch
 from app.utils import update_list_page, get_cities_keyboard, get_positions_keyboard, AnyHandler, get_largest_photo, \
-    MenuStringHandler
+    MenuStringHandler, with_session, CITIES, POSITIONS, get_chat_profile, get_greeting_text
 
 HandlerFunction = Callable[[Update, CallbackContext], Any]
 
@@ -37,8 +39,8 @@ def admin_required(handler: HandlerFunction) -> HandlerFunction:
     def wrapper(update: Update, context: CallbackContext):
         message: Message = update.message or update.callback_query.message
         chat_id = message.chat_id
-        chat = UserChat.query.get(chat_id)
-        if not chat.is_admin:
+        chat = get_chat_profile(chat_id)
+        if not chat or not chat.is_admin:
             app.logger.info('Access denied to admin handler')
             return
 
@@ -47,38 +49,6 @@ def admin_required(handler: HandlerFunction) -> HandlerFunction:
     return wrapper
 
 
-def send_post(post: Post):
-    query = db.session.query(Subscription).distinct(Subscription.chat_id)
-    if post.city_id is not None:
-        query = query.filter(Subscription.city_id == post.city_id)
-    if post.position_id is not None:
-        query = query.filter(Subscription.position_id == post.position_id)
-
-    items = query.all()
-    for subscription in items:
-        if post.image_id:
-            bot.send_photo(
-                chat_id=subscription.chat_id,
-                photo=post.image_id,
-                caption=post.text,
-                parse_mode="Markdown",
-                disable_web_page_preview=False,
-            )
-
-        else:
-            bot.send_message(
-                chat_id=subscription.chat_id,
-                text=post.text,
-                parse_mode='Markdown',
-                disable_web_page_preview=False,
-            )
-
-    post.date_sent = utc_now()
-    db.session.commit()
-
-    return items
-
-
 def _get_post_id(update: Update):
     callback_query: CallbackQuery = update.callback_query
     callback_query.answer()
@@ -88,8 +58,7 @@ def _get_post_id(update: Update):
 
 @admin_required
 def get_greeting(update: Update, context: CallbackContext):
-    greeting = Greeting.query.get(1)
-    text = greeting.text if greeting else DEFAULT_GREETING
+    text = get_greeting_text() or DEFAULT_GREETING
     update.message.reply_text(
         "Напиши мені текст, яким я буду вітатися з новими користувачами. Якщо усе "
         "супер, то введи команду /cancel\n\n"
@@ -180,12 +149,11 @@ def save_post(update: Update, context: CallbackContext):
     return ConversationHandler.END
 
 
-def _send_job_post(post: Post, update: Update):
-    # build reply text
+def _get_post_markup(post: Post) -> InlineKeyboardMarkup:
     buttons = []
 
-    city = City.query.get(post.city_id) if post.city_id is not None else None
-    position = Position.query.get(post.position_id) if post.position_id is not None else None
+    city = CITIES.get(post.city_id)
+    position = POSITIONS.get(post.position_id)
 
     city_text = f'Змінити місто ({city.name})' if city else 'Додати місто 🏙️'
     button = InlineKeyboardButton(text=city_text, callback_data=f'post.{post.id}.city.page')
@@ -201,15 +169,20 @@ def _send_job_post(post: Post, update: Update):
     button = InlineKeyboardButton(text='Видалити ❌', callback_data=f'post.{post.id}.delete')
     buttons.append([button])
 
-    message_text = post.text
-
     if post.is_sent:
         values = '/'.join(i.name for i in [city, position] if i)
         text = 'Відправлено 🎉 {}'.format(f'({values})' if values else '')
         button = InlineKeyboardButton(text=text, callback_data=f'post.{post.id}.none')
         buttons = [[button]]
 
-    markup = InlineKeyboardMarkup(buttons, resize_keyboard=True)
+    return InlineKeyboardMarkup(buttons, resize_keyboard=True)
+
+
+def _send_job_post(post: Post, update: Update):
+    # build reply text
+    markup = _get_post_markup(post)
+    message_text = post.text
+
     message: Message = update.message or update.callback_query.message
     if update.callback_query:
         if post.image_id:
@@ -241,6 +214,77 @@ def _send_job_post(post: Post, update: Update):
         )
 
 
+def _edit_admin_message(post: Post, text: str, markup: InlineKeyboardMarkup = None, parse_mode: str = None):
+    """ Edit message of admin, that published the post, outside of update handler """
+    try:
+        if post.image_id:
+            bot.edit_message_caption(
+                chat_id=post.admin_chat_id,
+                message_id=post.admin_message_id,
+                caption=text,
+                reply_markup=markup,
+                parse_mode=parse_mode,
+            )
+        else:
+            bot.edit_message_text(
+                chat_id=post.admin_chat_id,
+                message_id=post.admin_message_id,
+                text=text,
+                reply_markup=markup,
+                parse_mode=parse_mode,
+            )
+    except TelegramError as error:
+        # e.g. message is not modified or was deleted by admin
+        app.logger.warning(f'Message of post {post.id} is not edited: {error}')
+
+
+def get_progress_text(processed: int, total: int) -> str:
+    return f'Відправляємо повідомлення ⌛ {processed} з {total}'
+
+
+BROADCASTS = set()
+BROADCASTS_LOCK = threading.Lock()
+
+
+def start_broadcast(post_id: int):
+    """
+    Send published post in its own thread, so long sending doesn't block job
+    queue and handlers. Post that is being sent already is not started again
+    """
+    with BROADCASTS_LOCK:
+        if post_id in BROADCASTS:
+            return
+        BROADCASTS.add(post_id)
+    threading.Thread(target=broadcast_post, args=(post_id,), name=f'post-{post_id}', daemon=True).start()
+
+
+@with_session
+def broadcast_post(post_id: int):
+    """
+    Send published post by batches of recipients and show progress to admin
+    after every batch, until all recipients are processed
+    """
+    try:
+        while True:
+            post = Post.query.get(post_id)
+            if post is None or post.is_sent:
+                return
+
+            if send_post_batch(post):
+                post.date_sent = utc_now()
+                db.session.commit()
+                _edit_admin_message(post, post.text, markup=_get_post_markup(post), parse_mode='Markdown')
+                return
+
+            processed, total = PostChat.get_progress(post.id)
+            _edit_admin_message(post, get_progress_text(processed, total))
+    except Exception as error:
+        app.logger.exception(msg=f'Error on sending post {post_id}', exc_info=error)
+    finally:
+        with BROADCASTS_LOCK:
+            BROADCASTS.discard(post_id)
+
+
 def city_page(update: Update, context: CallbackContext):
     post_id = _get_post_id(update)
     post = Post.query.get(post_id)
@@ -322,16 +366,19 @@ def delete_post(update: Update, context: CallbackContext):
 def publish_post(update: Update, context: CallbackContext):
     post_id = _get_post_id(update)
     post = Post.query.get(post_id)
+    if post.is_published:
+        return
 
-    text = 'Відправляємо повідомлення ⌛'
-    if post.image_id:
-        update.callback_query.message.edit_caption(caption=text)
-    else:
-        update.callback_query.edit_message_text(text)
-
-    send_post(post)
+    message: Message = update.callback_query.message
+    post.date_published = utc_now()
+    post.admin_chat_id = message.chat_id
+    post.admin_message_id = message.message_id
+    enqueue_post(post)
+    db.session.commit()
 
-    _send_job_post(post, update)
+    _, total = PostChat.get_progress(post.id)
+    _edit_admin_message(post, get_progress_text(0, total))
+    start_broadcast(post.id)
 
 
 def cancel_create_post(update: Update, context: CallbackContext):
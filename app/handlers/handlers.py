@@ -3,19 +3,19 @@ from telegram.ext import (
     CommandHandler,
     CallbackContext,
     Dispatcher,
+    TypeHandler,
 )
 
-from app.contants import MENU, ADMIN_MENU, DEFAULT_GROUP
+from app.contants import MENU, ADMIN_MENU, DEFAULT_GROUP, SESSION_GROUP
 from app.enum import Menu
 from app.handlers import admin, user
-from app.models import UserChat
-from app.utils import MenuStringHandler
+from app.utils import MenuStringHandler, remove_session, handle_error, get_chat_profile
 
 
 def help_(update: Update, context: CallbackContext):
     chat_id = update.message.chat_id
-    chat = UserChat.query.get(chat_id)
-    menu = ADMIN_MENU if chat.is_admin else MENU
+    chat = get_chat_profile(chat_id)
+    menu = ADMIN_MENU if chat and chat.is_admin else MENU
     update.message.reply_text(menu, parse_mode='Markdown')
 
 
@@ -26,3 +26,6 @@ def configure_dispatcher(dp: Dispatcher):
 
     dp.add_handler(MenuStringHandler(Menu.help, help_), group=DEFAULT_GROUP)
     dp.add_handler(CommandHandler('help', help_), group=DEFAULT_GROUP)
+
+    dp.add_handler(TypeHandler(Update, remove_session), group=SESSION_GROUP)
+    dp.add_error_handler(handle_error)
@@ -13,9 +13,9 @@ from telegram.ext import (
 from app import db, parser, sender, updater
 from app.contants import DEFAULT_GREETING, ADMIN_MENU, MENU, DEFAULT_GROUP
 from app.enum import AddSubscriptionStates, SubscriptionPageState, Action, Menu
-from app.models import City, Position, Subscription, UserChat, Greeting, Stat
+from app.models import City, Position, Subscription, UserChat, Stat
 from app.utils import get_cities_keyboard, update_list_page, get_positions_keyboard, AnyHandler, get_keyboard_menu, \
-    MenuStringHandler
+    MenuStringHandler, CITIES, POSITIONS, get_greeting_text
 
 
 def start(update: Update, context: CallbackContext):
@@ -24,6 +24,7 @@ def start(update: Update, context: CallbackContext):
     if update.message and update.message.from_user:
         user_name = update.message.from_user.username
 
+    # cached profile can be stale, so chat is always checked in database
     chat = UserChat(
         id=update.message.chat_id,
         is_admin=False,
@@ -33,8 +34,7 @@ def start(update: Update, context: CallbackContext):
     chat = chat.soft_add()
 
     # select greeting and menu item
-    item = Greeting.query.first()
-    greeting = item.text if item else DEFAULT_GREETING
+    greeting = get_greeting_text() or DEFAULT_GREETING
 
     greeting += f"\n\n{MENU if chat.is_admin else ADMIN_MENU}"
 
@@ -65,7 +65,7 @@ def add_city_navigate(update: Update, context: CallbackContext):
 def add_city(update: Update, context: CallbackContext):
     callback_query: CallbackQuery = update.callback_query
     _, suffix = callback_query.data.strip().split('.')
-    city = City.query.filter_by(id=suffix).first()
+    city = CITIES.get(suffix)
 
     callback_query.answer(
         callback_query=callback_query.id,
@@ -103,9 +103,9 @@ def add_subscription_fallback(update: Update, context: CallbackContext):
 def add_position(update: Update, context: CallbackContext):
     callback_query: CallbackQuery = update.callback_query
     _, suffix = callback_query.data.strip().split('.')
-    position = Position.query.filter_by(id=suffix).first()
+    position = POSITIONS.get(suffix)
     city_id: str = context.user_data['city_id']
-    city = City.query.get(city_id)
+    city = CITIES.get(city_id)
     message: Message = callback_query.message
 
     subscription = Subscription(
@@ -260,6 +260,19 @@ def unsubscribe_all(update: Update, context: CallbackContext):
     update.message.reply_text("На жаль, ти відписався від всіх усіх розсилок вакансій 😞")
 
 
+def toggle_digest(update: Update, context: CallbackContext):
+    chat = UserChat.query.get(update.message.chat_id)
+    chat.digest = not chat.digest
+    db.session.commit()
+
+    text = (
+        "Тепер нові вакансії надходитимуть одним повідомленням-дайджестом 📰"
+        if chat.digest else
+        "Тепер кожна вакансія надходитиме окремим повідомленням"
+    )
+    update.message.reply_text(text, reply_markup=get_keyboard_menu(update))
+
+
 def cancel_add_subscription_command(update: Update, context: CallbackContext):
     result = cancel_add_subscription(update, context)
     updater.dispatcher.process_update(update)
@@ -304,3 +317,6 @@ def add_user_handlers(dp: Dispatcher):
 
     dp.add_handler(MenuStringHandler(Menu.unsubscribe, unsubscribe_all), group=DEFAULT_GROUP)
     dp.add_handler(CommandHandler('unsubscribe', unsubscribe_all), group=DEFAULT_GROUP)
+
+    dp.add_handler(MenuStringHandler(Menu.digest, toggle_digest), group=DEFAULT_GROUP)
+    dp.add_handler(CommandHandler('digest', toggle_digest), group=DEFAULT_GROUP)
@@ -1,6 +1,9 @@
 import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
 import sqlalchemy as sa
 from sqlalchemy import orm
+from sqlalchemy.dialects import postgresql
 from app import db
 from app.enum import Action
 
@@ -10,9 +13,13 @@ utc_now = datetime.datetime.utcnow
 class UserChat(db.Model):
     __tablename__ = 'user_chat'
 
-    id = db.Column(db.Integer, primary_key=True)
+    # chat id of Telegram, ids of supergroups don't fit into integer
+    id = db.Column(db.BigInteger, primary_key=True)
     is_admin = db.Column(db.Boolean, nullable=False, default=False)
+    # chat is deactivated when bot is blocked or chat is deleted
     is_active = db.Column(db.Boolean, nullable=False, default=True)
+    # several vacancies are sent in one message with titles and links
+    digest = db.Column(db.Boolean, nullable=False, default=False, server_default=sa.false())
     context = db.Column(db.JSON, nullable=False, default=lambda: {})
     user_name = db.Column(db.String(length=256), nullable=True)
     date_created = db.Column(db.DateTime, default=utc_now)
@@ -29,17 +36,82 @@ class UserChat(db.Model):
             db.session.add(stat)
             db.session.commit()
             return self
+        if not chat.is_active:
+            chat.is_active = True
+            db.session.commit()
         return chat
 
+    @staticmethod
+    def deactivate(chat_id: int) -> None:
+        """ Stop sending to the chat, its unsent vacancies are failed. Transaction is not committed here """
+        UserChat.query.filter_by(id=chat_id).update({'is_active': False}, synchronize_session=False)
+        (
+            VacancyChat.query
+            .filter(
+                VacancyChat.chat_id == chat_id,
+                VacancyChat.date_sent.is_(None),
+                VacancyChat.date_failed.is_(None),
+            )
+            .update({'date_failed': utc_now()}, synchronize_session=False)
+        )
+
+    @staticmethod
+    def migrate(chat_id: int, new_chat_id: int) -> None:
+        """
+        Move chat with its subscriptions, vacancies, posts and statistic to the new id,
+        when group is migrated to supergroup. Transaction is not committed here
+        """
+        params = {'old': chat_id, 'new': new_chat_id}
+        statements = [
+            """
+            INSERT INTO user_chat (id, is_admin, is_active, digest, context, user_name, date_created)
+            SELECT :new, is_admin, is_active, digest, context, user_name, date_created
+            FROM user_chat WHERE id = :old
+            ON CONFLICT (id) DO NOTHING
+            """,
+            """
+            UPDATE subscription SET chat_id = :new
+            WHERE chat_id = :old AND NOT EXISTS (
+                SELECT 1 FROM subscription AS existing
+                WHERE existing.chat_id = :new
+                    AND existing.city_id = subscription.city_id
+                    AND existing.position_id = subscription.position_id
+            )
+            """,
+            """
+            UPDATE vacancy_chat SET chat_id = :new
+            WHERE chat_id = :old AND NOT EXISTS (
+                SELECT 1 FROM vacancy_chat AS existing
+                WHERE existing.chat_id = :new AND existing.vacancy_id = vacancy_chat.vacancy_id
+            )
+            """,
+            """
+            UPDATE post_chat SET chat_id = :new
+            WHERE chat_id = :old AND NOT EXISTS (
+                SELECT 1 FROM post_chat AS existing
+                WHERE existing.chat_id = :new AND existing.post_id = post_chat.post_id
+            )
+            """,
+            'UPDATE stat SET chat_id = :new WHERE chat_id = :old',
+            'DELETE FROM subscription WHERE chat_id = :old',
+            'DELETE FROM vacancy_chat WHERE chat_id = :old',
+            'DELETE FROM post_chat WHERE chat_id = :old',
+            'DELETE FROM user_chat WHERE id = :old',
+        ]
+        for statement in statements:
+            db.session.execute(sa.text(statement), params)
+
 
 class Subscription(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('chat_id', 'city_id', 'position_id', name='unique_user_subscription'),
+        # subscribers of vacancy parameters or post
+        db.Index('ix_subscription_city_position', 'city_id', 'position_id'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    chat_id = db.Column(db.Integer, db.ForeignKey('user_chat.id'), nullable=False)
+    chat_id = db.Column(db.BigInteger, db.ForeignKey('user_chat.id'), nullable=False)
     city_id = db.Column(db.Integer, db.ForeignKey('city.id'), nullable=False)
     position_id = db.Column(db.Integer, db.ForeignKey('position.id'), nullable=False)
     date_created = db.Column(db.DateTime, default=utc_now)
@@ -96,7 +168,7 @@ class Stat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     action = db.Column(db.String(56), nullable=False)
     date = db.Column(db.DateTime, default=utc_now)
-    chat_id = db.Column(db.Integer, db.ForeignKey('user_chat.id'), nullable=False)
+    chat_id = db.Column(db.BigInteger, db.ForeignKey('user_chat.id'), nullable=False)
     meta = db.Column(db.JSON, nullable=False, default=lambda: {})
 
 
@@ -108,11 +180,47 @@ class Post(db.Model):
     position_id = db.Column(db.Integer, db.ForeignKey('position.id'), nullable=True)
     date_sent = db.Column(db.DateTime, nullable=True)
     image_id = db.Column(db.String(length=512), nullable=True)
+    # post is sent in background, progress is shown in the message of admin
+    date_published = db.Column(db.DateTime, nullable=True)
+    admin_chat_id = db.Column(db.BigInteger, nullable=True)
+    admin_message_id = db.Column(db.Integer, nullable=True)
 
     @property
     def is_sent(self):
         return self.date_sent is not None
 
+    @property
+    def is_published(self):
+        return self.date_published is not None
+
+
+class PostChat(db.Model):
+    """ Table for storing progress of post sending for every recipient """
+
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'chat_id', name='unique_post_chat'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False)
+    chat_id = db.Column(db.BigInteger, db.ForeignKey('user_chat.id'), nullable=False)
+    date_created = db.Column(db.DateTime, nullable=False, default=utc_now)
+    date_sent = db.Column(db.DateTime, nullable=True)
+    date_failed = db.Column(db.DateTime, nullable=True)
+
+    @staticmethod
+    def get_progress(post_id: int) -> Tuple[int, int]:
+        """ Number of processed (sent or failed) recipients and number of all recipients """
+        processed, total = (
+            db.session.query(
+                db.func.count(PostChat.date_sent) + db.func.count(PostChat.date_failed),
+                db.func.count(PostChat.id),
+            )
+            .filter(PostChat.post_id == post_id)
+            .one()
+        )
+        return processed, total
+
 
 class Vacancy(db.Model):
     """ Table for storing vacancies metadata """
@@ -124,7 +232,7 @@ class Vacancy(db.Model):
     title = db.Column(db.Text, nullable=False)
     text = db.Column(db.Text, nullable=False)
     date = db.Column(db.DateTime, nullable=False)
-    date_created = db.Column(db.DateTime, nullable=False, default=utc_now)
+    date_created = db.Column(db.DateTime, nullable=False, default=utc_now, index=True)
     date_processed = db.Column(db.DateTime, nullable=True)
 
     def get_not_processed_parameters(self):
@@ -137,14 +245,42 @@ class Vacancy(db.Model):
             .all()
         )
 
-    def soft_add(self) -> 'Vacancy':
-        chat = Vacancy.query.filter(Vacancy.url == self.url).first()
-        if not chat:
-            db.session.add(self)
-            db.session.commit()
-            db.session.refresh(self)
-            return self
-        return chat
+    @staticmethod
+    def get_ids(urls: List[str]) -> Dict[str, int]:
+        """ Get ids of stored vacancies by their urls """
+        if not urls:
+            return {}
+        return dict(db.session.query(Vacancy.url, Vacancy.id).filter(Vacancy.url.in_(urls)))
+
+    @staticmethod
+    def bulk_add(vacancies: List['Vacancy']) -> Dict[str, int]:
+        """
+        Insert not existing vacancies with one statement and return ids of
+        given vacancies by their urls. Transaction is not committed here
+        """
+        rows = {}
+        for vacancy in vacancies:
+            rows.setdefault(vacancy.url, {
+                'url': vacancy.url,
+                'title': vacancy.title,
+                'text': vacancy.text,
+                'date': vacancy.date,
+            })
+        if not rows:
+            return {}
+
+        table = Vacancy.__table__
+        statement = (
+            postgresql.insert(table)
+            .values(list(rows.values()))
+            .on_conflict_do_nothing(constraint='unique_vacancy')
+            .returning(table.c.url, table.c.id)
+        )
+        ids = dict(db.session.execute(statement).fetchall())
+
+        # vacancies, that were inserted concurrently by someone else
+        ids.update(Vacancy.get_ids([url for url in rows if url not in ids]))
+        return ids
 
     def __repr__(self):
         return f'<Vacancy title={self.title[:50]} text={self.title[:50]}>'
@@ -158,6 +294,8 @@ class VacancyParameters(db.Model):
             'city_id', 'position_id', 'vacancy_id',
             name='unique_vacancy_parameters',
         ),
+        # lookups by city and position are served by the unique constraint
+        db.Index('ix_vacancy_parameters_vacancy_id', 'vacancy_id'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -177,13 +315,26 @@ class VacancyParameters(db.Model):
         lazy=True,
     )
 
-    def exists(self) -> bool:
-        vacancy = VacancyParameters.query.filter(
-            VacancyParameters.city_id == self.city_id,
-            VacancyParameters.position_id == self.position_id,
-            VacancyParameters.vacancy_id == self.vacancy_id,
-        ).first()
-        return bool(vacancy)
+    @staticmethod
+    def bulk_add(city_id: int, position_id: int, vacancy_ids: List[int]) -> Set[int]:
+        """
+        Insert not existing parameters with one statement and return ids of
+        vacancies, that got new parameters. Transaction is not committed here
+        """
+        if not vacancy_ids:
+            return set()
+
+        table = VacancyParameters.__table__
+        statement = (
+            postgresql.insert(table)
+            .values([
+                {'city_id': city_id, 'position_id': position_id, 'vacancy_id': vacancy_id}
+                for vacancy_id in vacancy_ids
+            ])
+            .on_conflict_do_nothing(constraint='unique_vacancy_parameters')
+            .returning(table.c.vacancy_id)
+        )
+        return {row.vacancy_id for row in db.session.execute(statement)}
 
 
 class VacancyChat(db.Model):
@@ -194,25 +345,152 @@ class VacancyChat(db.Model):
             'chat_id', 'vacancy_id',
             name='unique_vacancy_chat',
         ),
+        db.Index('ix_vacancy_chat_vacancy_id', 'vacancy_id'),
+        # small index of rows that are waiting for sending, see `claim`
+        db.Index(
+            'ix_vacancy_chat_pending', 'id',
+            postgresql_where=sa.text('date_sent IS NULL AND date_failed IS NULL'),
+        ),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    chat_id = db.Column(db.Integer, db.ForeignKey('user_chat.id'), nullable=False)
+    chat_id = db.Column(db.BigInteger, db.ForeignKey('user_chat.id'), nullable=False)
     vacancy_id = db.Column(db.Integer, db.ForeignKey('vacancy.id'), nullable=False)
     attempt = db.Column(db.Integer, nullable=False, default=1)
     date_created = db.Column(db.DateTime, nullable=False, default=utc_now)
     date_sent = db.Column(db.DateTime, nullable=True)
+    # row is claimed for sending by some worker until this time
+    lease_until = db.Column(db.DateTime, nullable=True)
+    # failed row is sent again not earlier than this time
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    # row failed permanently or exhausted its attempts, it's not sent anymore
+    date_failed = db.Column(db.DateTime, nullable=True)
 
-    def find(self):
-        query = VacancyChat.query.filter_by(chat_id=self.chat_id, vacancy_id=self.vacancy_id)
-        return query.first() or self
-
-    def soft_add(self):
-        chat = self.find()
-        db.session.add(chat)
-        db.session.commit()
-        return chat
-
+    @staticmethod
+    def bulk_add(chat_id: int, vacancy_ids: List[int]) -> None:
+        """ Insert not existing rows with one statement. Transaction is not committed here """
+        if not vacancy_ids:
+            return
+
+        statement = (
+            postgresql.insert(VacancyChat.__table__)
+            .values([
+                {'chat_id': chat_id, 'vacancy_id': vacancy_id, 'attempt': 0, 'date_created': utc_now()}
+                for vacancy_id in vacancy_ids
+            ])
+            .on_conflict_do_nothing(constraint='unique_vacancy_chat')
+        )
+        db.session.execute(statement)
 
+    @staticmethod
+    def claim(
+            limit: int,
+            lease: datetime.timedelta,
+            chat_id: Optional[int] = None,
+            vacancy_ids: Optional[List[int]] = None,
+    ) -> List[int]:
+        """
+        Lease unsent rows for sending and return their ids. Rows that are locked
+        or leased by other workers are skipped, so several workers can send
+        messages at the same time. Transaction should be committed right away
+        """
+        table = VacancyChat.__table__
+        now = utc_now()
+        pending = (
+            sa.select([table.c.id])
+            .where(table.c.date_sent.is_(None))
+            .where(table.c.date_failed.is_(None))
+            .where(sa.or_(table.c.next_attempt_at.is_(None), table.c.next_attempt_at <= now))
+            .where(sa.or_(table.c.lease_until.is_(None), table.c.lease_until < now))
+            .order_by(table.c.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        if chat_id is not None:
+            pending = pending.where(table.c.chat_id == chat_id)
+        if vacancy_ids is not None:
+            pending = pending.where(table.c.vacancy_id.in_(vacancy_ids))
+
+        statement = (
+            table.update()
+            .where(table.c.id.in_(pending))
+            .values(lease_until=now + lease)
+            .returning(table.c.id)
+        )
+        return sorted(row.id for row in db.session.execute(statement))
 
+    @staticmethod
+    def bulk_update_status(statuses: List['DeliveryStatus']) -> None:
+        """ Save results of sending with one statement. Transaction is not committed here """
+        if not statuses:
+            return
+
+        values = []
+        params = {}
+        for index, status in enumerate(statuses):
+            values.append(
+                f'(:id_{index}, CAST(:sent_{index} AS TIMESTAMP), '
+                f'CAST(:next_{index} AS TIMESTAMP), CAST(:failed_{index} AS TIMESTAMP))'
+            )
+            params[f'id_{index}'] = status.id
+            params[f'sent_{index}'] = status.date_sent
+            params[f'next_{index}'] = status.next_attempt_at
+            params[f'failed_{index}'] = status.date_failed
+
+        statement = sa.text(f"""
+            UPDATE vacancy_chat
+            SET
+                date_sent = COALESCE(status.date_sent, vacancy_chat.date_sent),
+                attempt = vacancy_chat.attempt + CASE WHEN status.date_sent IS NULL THEN 1 ELSE 0 END,
+                next_attempt_at = status.next_attempt_at,
+                date_failed = status.date_failed,
+                lease_until = NULL
+            FROM (VALUES {', '.join(values)}) AS status (id, date_sent, next_attempt_at, date_failed)
+            WHERE vacancy_chat.id = status.id
+        """)
+        db.session.execute(statement, params)
+
+
+class DeliveryStatus(NamedTuple):
+    """ Result of sending of VacancyChat row """
+
+    id: int
+    # date of sending, None when message was not sent
+    date_sent: Optional[datetime.datetime] = None
+    # time of the next attempt after transient error
+    next_attempt_at: Optional[datetime.datetime] = None
+    # date of permanent error, such rows are never sent again
+    date_failed: Optional[datetime.datetime] = None
+
+
+class Feed(db.Model):
+    """ Table for storing HTTP cache metadata of fetched feeds """
+
+    __table_args__ = (db.UniqueConstraint('url', name='unique_feed_url'),)
 
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.Text, nullable=False)
+    etag = db.Column(db.Text, nullable=True)
+    last_modified = db.Column(db.Text, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    # the newest processed entry of the feed
+    last_entry_date = db.Column(db.DateTime, nullable=True)
+    last_entry_url = db.Column(db.Text, nullable=True)
+    # average number of new vacancies per hour and time of the next polling
+    new_rate = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    next_poll_at = db.Column(db.DateTime, nullable=True)
+    date_created = db.Column(db.DateTime, nullable=False, default=utc_now)
+    date_checked = db.Column(db.DateTime, nullable=True)
+    date_updated = db.Column(db.DateTime, nullable=True)
+
+    def is_due(self, now: datetime.datetime) -> bool:
+        return self.next_poll_at is None or self.next_poll_at <= now
+
+    def get_headers(self) -> Dict[str, str]:
+        """ Headers for conditional request of the feed """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
@@ -1,21 +1,57 @@
+import hashlib
+import math
 import re
-import ssl
-from datetime import datetime
-from typing import Iterator, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Iterator, List, Dict, Optional, NamedTuple, Container, Iterable, Tuple
 from urllib.parse import quote
 
 import feedparser
-from bs4 import BeautifulSoup
 
 from app import db, app
-from app.models import Subscription, City, Position, Vacancy, VacancyParameters
-
-ssl._create_default_https_context = ssl._create_unverified_context
+from app.fetcher import download
+from app.models import Subscription, City, Position, Vacancy, VacancyParameters, Feed, UserChat, utc_now
+from app.render import get_blocks, escape_markdown_symbols
+from app.utils import LRUCache
 
 URL = 'https://jobs.dou.ua/vacancies/feeds/?'
 
 MESSAGE_LIMIT = 4095
 
+# urls and ids of already stored vacancies, the same vacancy appears in many
+# feeds, so it's checked here before rendering vacancy text
+KNOWN_VACANCIES = LRUCache(size=10000)
+
+# channel build date is changed on every request, so it is ignored in content hash
+BUILD_DATE_RE = re.compile(rb'<lastBuildDate>.*?</lastBuildDate>')
+
+
+# location of a vacancy is listed at the end of entry title, e.g.
+# "Python Developer в Company, Київ, віддалено", remote work is written
+# differently from the name of the remote city
+REMOTE_PARAM = 'remote'
+REMOTE_LOCATION = 'віддалено'
+RELOCATE_PARAM = 'relocate'
+
+# weight of the last poll in the average rate of new vacancies of the feed
+NEW_RATE_SMOOTHING = 0.3
+
+
+class FeedPlan(NamedTuple):
+    position: Position
+    # subscribed cities, that get vacancies from the feed
+    cities: List[City]
+    # feed of the whole category, vacancies are assigned to cities by entry title
+    coalesced: bool
+
+
+class FeedResponse(NamedTuple):
+    # parsed feed or None, when feed was not changed since previous request
+    data: Optional[feedparser.FeedParserDict]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+
 
 def remove_markdown_symbols(text):
     return (
@@ -24,52 +60,25 @@ def remove_markdown_symbols(text):
     )
 
 
-def escape_markdown_symbols(text):
-    return (
-        text.replace("_", "\\_")
-        .replace("*", "\\*")
-        .replace("[", "\\[")
-        .replace("`", "\\`")
-    )
-
-
 def build_feed_url(city: City, position: Position) -> str:
     return safe_url(f'{URL}{position.param}&{city.param}')
 
 
-def safe_url(url):
-    return quote(url, safe='/:?=&')
-
+def build_category_feed_url(position: Position) -> str:
+    return safe_url(f'{URL}{position.param}')
 
-def get_block_text(soup: BeautifulSoup, class_: str):
-    requirements = soup.find("div", {"class": class_})
-    if not requirements:
-        return None
 
-    raw_text = requirements.find("div", {"class": 'text'})
-    if not raw_text:
-        return None
-
-    for match in raw_text.findAll('span'):
-        match.unwrap()
-
-    for br in raw_text.find_all("br"):
-        br.replace_with("\n")
-
-    text = raw_text.get_text()
-    text = re.sub(r'[ \t]+', r' ', text)
-    text = re.sub(r'\n+', r'\n', text)
-    text = escape_markdown_symbols(text)
-    return text.strip()
+def safe_url(url):
+    return quote(url, safe='/:?=&')
 
 
 def prepare_text(text: str):
-    soup = BeautifulSoup(text, 'html.parser')
-    requirements = get_block_text(soup, 'requirements')
-    skills = get_block_text(soup, 'additionalskils')
-    bonuses = get_block_text(soup, 'bonuses')
-    duty = get_block_text(soup, 'duty')
-    project = get_block_text(soup, 'project')
+    blocks = get_blocks(text)
+    requirements = blocks['requirements']
+    skills = blocks['additionalskils']
+    bonuses = blocks['bonuses']
+    duty = blocks['duty']
+    project = blocks['project']
 
     # vacancy text in telegram markdown
     result = ''
@@ -86,11 +95,39 @@ def prepare_text(text: str):
     return result
 
 
-def parse_vacancies(data: feedparser.FeedParserDict) -> Iterator[Vacancy]:
-    for entry in data.get('entries', []):
+def get_entry_date(entry: feedparser.FeedParserDict) -> datetime:
+    year, month, day, hour, minutes, seconds, *_ = entry.published_parsed
+    return datetime(year, month, day, hour, minutes, seconds)
+
+
+def iter_new_entries(
+        entries: Iterable[feedparser.FeedParserDict],
+        last_date: Optional[datetime],
+        last_url: Optional[str],
+) -> Iterator[feedparser.FeedParserDict]:
+    """
+    Feed is ordered from the newest entries, so iteration stops on the first
+    entry that is not newer than the last seen entry of the feed
+    """
+    for entry in entries:
+        if last_url is not None and entry.get('link') == last_url:
+            return
         try:
-            year, month, day, hour, minutes, seconds, *_ = entry.published_parsed
-            date = datetime(year, month, day, hour, minutes, seconds)
+            date = get_entry_date(entry)
+        except Exception:
+            date = None
+        if last_date is not None and date is not None and date < last_date:
+            return
+        yield entry
+
+
+def parse_vacancies(entries: Iterable[feedparser.FeedParserDict], known: Container[str] = ()) -> Iterator[Vacancy]:
+    for entry in entries:
+        if entry.get('link') in known:
+            continue
+
+        try:
+            date = get_entry_date(entry)
             text = prepare_text(entry.description)
             url = entry.link
         except Exception as exception:
@@ -111,38 +148,349 @@ def parse_vacancies(data: feedparser.FeedParserDict) -> Iterator[Vacancy]:
         yield Vacancy(url=url, title=entry.title, text=result, date=date)
 
 
+def get_content_hash(content: bytes) -> str:
+    return hashlib.sha256(BUILD_DATE_RE.sub(b'', content)).hexdigest()
+
+
+def fetch_feed(
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        content_hash: Optional[str] = None,
+) -> FeedResponse:
+    """
+    Download and parse feed, safe for calling from worker threads. Parsing
+    is skipped when server responds with 304 or content hash is not changed
+    """
+    response = download(url, headers)
+    if response.status == 304:
+        return FeedResponse(data=None, etag=None, last_modified=None, content_hash=content_hash)
+
+    new_hash = get_content_hash(response.content)
+    data = feedparser.parse(response.content) if new_hash != content_hash else None
+    return FeedResponse(
+        data=data,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        content_hash=new_hash,
+    )
+
+
+def get_vacancy_ids(urls: List[str]) -> Dict[str, int]:
+    """ Find ids of stored vacancies, in-process cache is checked before database """
+    ids = {}
+    for url in urls:
+        vacancy_id = KNOWN_VACANCIES.get(url)
+        if vacancy_id is not None:
+            ids[url] = vacancy_id
+
+    ids.update(Vacancy.get_ids([url for url in urls if url not in ids]))
+    return ids
+
+
+def store_vacancies(entries: List[feedparser.FeedParserDict]) -> Dict[str, int]:
+    """ Add vacancies of entries and return their ids, only not stored vacancies are rendered """
+    urls = [entry.link for entry in entries if entry.get('link')]
+    ids = get_vacancy_ids(urls)
+    ids.update(Vacancy.bulk_add(list(parse_vacancies(entries, known=ids))))
+    return ids
+
+
+def add_vacancy_parameters(
+        city: City,
+        position: Position,
+        entries: List[feedparser.FeedParserDict],
+        ids: Dict[str, int],
+) -> List[int]:
+    urls = [entry.link for entry in entries if entry.get('link')]
+    vacancy_ids = list(dict.fromkeys(ids[url] for url in urls if url in ids))
+    added = VacancyParameters.bulk_add(
+        city_id=city.id,
+        position_id=position.id,
+        vacancy_ids=vacancy_ids,
+    )
+    app.logger.info(
+        f'Added {len(added)} vacancies, skip {len(vacancy_ids) - len(added)} existing: '
+        f'{city.name}, {position.name}'
+    )
+    return vacancy_ids
+
+
+def commit_vacancies(ids: Dict[str, int]) -> None:
+    db.session.commit()
+    for url, vacancy_id in ids.items():
+        KNOWN_VACANCIES.set(url, vacancy_id)
+
+
+def save_vacancies(city: City, position: Position, entries: List[feedparser.FeedParserDict]) -> List[int]:
+    """
+    Store vacancies of the feed entries and their parameters in one transaction
+    and return ids of the vacancies. Only not stored vacancies are rendered
+    """
+    ids = store_vacancies(entries)
+    vacancy_ids = add_vacancy_parameters(city, position, entries, ids)
+    commit_vacancies(ids)
+    return vacancy_ids
+
+
+def get_locations() -> Dict[str, City]:
+    """ Cities by location name in entry title, cities without location can't be coalesced """
+    locations = {}
+    for city in City.query:
+        if city.param == REMOTE_PARAM:
+            locations[REMOTE_LOCATION] = city
+        elif city.param != RELOCATE_PARAM:
+            locations[city.name] = city
+    return locations
+
+
+def get_entry_cities(entry: feedparser.FeedParserDict, locations: Dict[str, City]) -> List[City]:
+    """ Cities of vacancy from entry title, empty list when location is not resolved """
+    _, *tokens = entry.get('title', '').split(',')
+    return [locations[token.strip()] for token in tokens if token.strip() in locations]
+
+
+def save_category_vacancies(
+        plan: FeedPlan,
+        entries: List[feedparser.FeedParserDict],
+        locations: Dict[str, City],
+) -> bool:
+    """
+    Store vacancies of the category feed for subscribed cities of the plan,
+    the same parameters are added as for feeds of every city. Returns False
+    when location of some entries is not resolved
+    """
+    resolved = True
+    assigned = {city.id: [] for city in plan.cities}
+    for entry in entries:
+        cities = get_entry_cities(entry, locations)
+        if not cities:
+            resolved = False
+        for city in cities:
+            if city.id in assigned:
+                assigned[city.id].append(entry)
+
+    # vacancies of not subscribed cities are not stored at all
+    needed = list({id(entry): entry for city_entries in assigned.values() for entry in city_entries}.values())
+    ids = store_vacancies(needed)
+    for city in plan.cities:
+        if assigned[city.id]:
+            add_vacancy_parameters(city, plan.position, assigned[city.id], ids)
+    commit_vacancies(ids)
+    return resolved
+
+
+def plan_feeds(pairs: List[Tuple[City, Position]], locations: Dict[str, City]) -> Dict[str, FeedPlan]:
+    """
+    Group subscribed pairs into feeds. When coalescing is enabled, cities that
+    can be found in entry titles are served by one feed of the category
+    """
+    coalesced = {city.id for city in locations.values()} if app.config['FEED_COALESCE'] else set()
+    plans = {}
+    for city, position in pairs:
+        if city.id in coalesced:
+            url = build_category_feed_url(position)
+            plans.setdefault(url, FeedPlan(position=position, cities=[], coalesced=True)).cities.append(city)
+        else:
+            plans[build_feed_url(city, position)] = FeedPlan(position=position, cities=[city], coalesced=False)
+    return plans
+
+
 def update_new_vacancies(city: City, position: Position) -> List[Vacancy]:
+    """
+    Fetch feed unconditionally, without feed cache. It's used for a new
+    subscription, that needs all vacancies from the feed even when feed
+    wasn't changed since the previous polling
+    """
     app.logger.info(f'Get feed for {city.name}, {position.name}')
 
     url = build_feed_url(city, position)
-    data = feedparser.parse(url)
-    vacancies = []
-    for vacancy in parse_vacancies(data):
-        vacancy = vacancy.soft_add()
-        vacancies.append(vacancy)
-
-        # insert new vacancy parameters
-        parameters = VacancyParameters(
-            city_id=city.id,
-            position_id=position.id,
-            vacancy_id=vacancy.id,
+    try:
+        response = fetch_feed(url)
+    except Exception as exception:
+        app.logger.exception(
+            msg=f'Exception during fetching feed {url}',
+            exc_info=exception,
         )
-        if parameters.exists():
-            app.logger.info(f'Vacancy exists, skip: {vacancy.title}')
+        return []
+
+    vacancy_ids = save_vacancies(city, position, response.data.entries)
+    if not vacancy_ids:
+        return []
+
+    vacancies = {vacancy.id: vacancy for vacancy in Vacancy.query.filter(Vacancy.id.in_(vacancy_ids))}
+    return [vacancies[vacancy_id] for vacancy_id in vacancy_ids if vacancy_id in vacancies]
+
+
+def get_poll_interval(new_rate: float, subscribers: int, previous: Optional[timedelta] = None) -> timedelta:
+    """
+    Feed is polled about as often as a new vacancy appears in it and feeds with
+    more subscribers are polled more often, within configured bounds. Feed
+    without known rate starts from the minimal interval and backs off twice
+    on every poll without new vacancies
+    """
+    minimum = app.config['FEED_MIN_INTERVAL']
+    maximum = app.config['FEED_MAX_INTERVAL']
+    if new_rate > 0:
+        minutes = 60 / new_rate / (1 + math.log2(max(subscribers, 1)))
+    elif previous is not None:
+        minutes = previous.total_seconds() / 60 * 2
+    else:
+        minutes = minimum
+    return timedelta(minutes=min(max(minutes, minimum), maximum))
+
+
+def schedule_feed(feed: Feed, new_entries: Optional[int], subscribers: int, now: datetime) -> None:
+    """ Update average rate (per hour) of new vacancies in the feed and plan the next poll """
+    if new_entries is not None and feed.date_checked is not None:
+        hours = max((now - feed.date_checked).total_seconds() / 3600, 1 / 60)
+        feed.new_rate = (
+            NEW_RATE_SMOOTHING * new_entries / hours
+            + (1 - NEW_RATE_SMOOTHING) * (feed.new_rate or 0)
+        )
+    previous = None
+    if feed.next_poll_at is not None and feed.date_checked is not None:
+        previous = feed.next_poll_at - feed.date_checked
+    feed.next_poll_at = now + get_poll_interval(feed.new_rate or 0, subscribers, previous)
+
+
+def update_feed(
+        feed: Feed,
+        response: FeedResponse,
+        entries: List[feedparser.FeedParserDict],
+        subscribers: int,
+) -> None:
+    now = utc_now()
+    # all entries are new on the first poll, so it says nothing about the rate
+    new_entries = len(entries) if feed.last_entry_date is not None or response.data is None else None
+    schedule_feed(feed, new_entries, subscribers, now)
+
+    feed.date_checked = now
+    if response.data is not None:
+        feed.date_updated = now
+
+    # remember the newest entry, next time feed is processed only up to it
+    for entry in entries:
+        try:
+            date = get_entry_date(entry)
+        except Exception:
             continue
-
-        db.session.add(parameters)
-        db.session.commit()
-        app.logger.info(f'New vacancy was added: {vacancy.title}')
-
-    return vacancies
+        if feed.last_entry_date is None or date >= feed.last_entry_date:
+            feed.last_entry_date = date
+            feed.last_entry_url = entry.link
+
+    feed.etag = response.etag or feed.etag
+    feed.last_modified = response.last_modified or feed.last_modified
+    feed.content_hash = response.content_hash
+    db.session.commit()
+
+
+def get_feeds(urls: List[str]) -> Dict[str, Feed]:
+    """ Get cache of feeds for given urls, cache of not polled feeds is removed """
+    Feed.query.filter(Feed.url.notin_(urls)).delete(synchronize_session=False)
+    feeds = {feed.url: feed for feed in Feed.query.filter(Feed.url.in_(urls))}
+    for url in urls:
+        if url not in feeds:
+            feeds[url] = Feed(url=url)
+            db.session.add(feeds[url])
+    db.session.commit()
+    return feeds
+
+
+def poll_feeds(
+        plans: Dict[str, FeedPlan],
+        feeds: Dict[str, Feed],
+        locations: Dict[str, City],
+        subscribers: Dict[Tuple[int, int], int],
+) -> List[Tuple[City, Position]]:
+    """
+    Fetch and store planned feeds, returns pairs of category feeds that have to
+    be fetched separately, because location of their vacancies is not resolved
+    """
+    unresolved = []
+
+    # feeds are downloaded and parsed by worker threads, but database is
+    # updated only from the current thread, because session is not thread-safe
+    with ThreadPoolExecutor(max_workers=app.config['FEED_WORKERS']) as executor:
+        futures = {}
+        for url in plans:
+            feed = feeds[url]
+            future = executor.submit(fetch_feed, url, feed.get_headers(), feed.content_hash)
+            futures[future] = url
+
+        for future in as_completed(futures):
+            url = futures[future]
+            plan = plans[url]
+            try:
+                response = future.result()
+            except Exception as exception:
+                app.logger.exception(
+                    msg=f'Exception during fetching feed {url}',
+                    exc_info=exception,
+                )
+                # failed feed is retried after the shortest interval
+                feeds[url].next_poll_at = utc_now() + timedelta(minutes=app.config['FEED_MIN_INTERVAL'])
+                db.session.commit()
+                continue
+
+            app.logger.info(f'Got feed {url}')
+            feed = feeds[url]
+            try:
+                entries = []
+                if response.data is None:
+                    app.logger.info(f'Feed was not changed, skip: {url}')
+                else:
+                    # entries are rendered only up to the newest entry of the previous poll
+                    entries = list(iter_new_entries(response.data.entries, feed.last_entry_date, feed.last_entry_url))
+                    if not plan.coalesced:
+                        save_vacancies(plan.cities[0], plan.position, entries)
+                    elif not save_category_vacancies(plan, entries, locations) or (
+                        # when the last seen entry is not in the feed anymore, some
+                        # vacancies could be pushed out from the feed of the category
+                        entries and len(entries) == len(response.data.entries)
+                    ):
+                        unresolved.extend((city, plan.position) for city in plan.cities)
+                update_feed(
+                    feed=feed,
+                    response=response,
+                    entries=entries,
+                    subscribers=sum(subscribers.get((city.id, plan.position.id), 0) for city in plan.cities),
+                )
+            except Exception as exception:
+                db.session.rollback()
+                app.logger.exception(
+                    msg=f'Exception during saving feed {url}',
+                    exc_info=exception,
+                )
+
+    return unresolved
 
 
 def get_new_vacancies():
+    """ Poll feeds of active chats that are due, see `schedule_feed` """
     subscriptions = (
-        db.session.query(Subscription, Position, City).join(Position).join(City)
-        .distinct(Subscription.position_id, Subscription.city_id).all()
+        db.session.query(City, Position, db.func.count(Subscription.id))
+        .select_from(Subscription)
+        .join(City, City.id == Subscription.city_id)
+        .join(Position, Position.id == Subscription.position_id)
+        .join(UserChat, UserChat.id == Subscription.chat_id)
+        .filter(UserChat.is_active.is_(True))
+        .group_by(City.id, Position.id)
+        .all()
     )
 
-    for subscription, position, city in subscriptions:
-        update_new_vacancies(city, position)
+    pairs = [(city, position) for city, position, _ in subscriptions]
+    subscribers = {(city.id, position.id): count for city, position, count in subscriptions}
+    locations = get_locations()
+    plans = plan_feeds(pairs, locations)
+
+    # feeds of every pair are kept for fallback from the category feeds
+    feeds = get_feeds(list(plans) + [build_feed_url(city, position) for city, position in pairs])
+
+    now = utc_now()
+    due = {url: plan for url, plan in plans.items() if feeds[url].is_due(now)}
+    app.logger.info(f'Poll {len(due)} of {len(plans)} feeds')
+
+    unresolved = poll_feeds(due, feeds, locations, subscribers)
+    if unresolved:
+        app.logger.info(f'Fetch {len(unresolved)} feeds separately, vacancies location is not resolved')
+        poll_feeds(plan_feeds(unresolved, locations={}), feeds, locations, subscribers)
@@ -0,0 +1,50 @@
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy.pool import QueuePool
+
+from app import app
+
+
+class TimedQueuePool(QueuePool):
+    """
+    Queue pool that measures time of waiting for a free connection, so
+    contention of threads for connections can be seen in logs and in /pool
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            self.record_wait(time.monotonic() - start)
+
+    def record_wait(self, wait: float) -> None:
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+        if wait >= app.config['POOL_WAIT_WARNING']:
+            app.logger.warning(f'Waited {wait:.3f} seconds for database connection: {self.status()}')
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                'overflow': self.overflow(),
+                'checkouts': self.checkouts,
+                'wait_total': round(self.wait_total, 6),
+                'wait_avg': round(self.wait_total / self.checkouts, 6) if self.checkouts else 0,
+                'wait_max': round(self.wait_max, 6),
+            }
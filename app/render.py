@@ -0,0 +1,240 @@
+import re
+from html.entities import name2codepoint
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+# DOU vacancy description blocks in order of appearance in the message
+BLOCKS = ('requirements', 'additionalskils', 'bonuses', 'duty', 'project')
+
+ENTITIES = {name: chr(codepoint) for name, codepoint in name2codepoint.items()}
+ENTITIES['apos'] = "'"
+
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+EMPTY_ELEMENT_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer',
+}
+
+SPACES_RE = re.compile(r'[ \t]+')
+NEW_LINES_RE = re.compile(r'\n+')
+
+
+def escape_markdown_symbols(text):
+    return (
+        text.replace("_", "\\_")
+        .replace("*", "\\*")
+        .replace("[", "\\[")
+        .replace("`", "\\`")
+    )
+
+
+def clean_block_text(text: str) -> Optional[str]:
+    text = SPACES_RE.sub(' ', text)
+    text = NEW_LINES_RE.sub('\n', text)
+    text = escape_markdown_symbols(text)
+    return text.strip()
+
+
+class _Block:
+    """ Search state of one description block, see `BlocksParser` """
+
+    __slots__ = ('block', 'text', 'skip', 'done', 'chunks')
+
+    def __init__(self):
+        # stack positions of block div, its text div and <br> that is replaced by new line
+        self.block = None
+        self.text = None
+        self.skip = None
+        self.done = False
+        self.chunks = None
+
+
+class BlocksParser(HTMLParser):
+    """
+    Extracts text of description blocks in one pass over the HTML.
+
+    Result is the same as searching `div.<block> div.text` in tree built by
+    BeautifulSoup with 'html.parser', replacing <br> with new lines and taking
+    `get_text()`. So tree building rules of BeautifulSoup are repeated here: void
+    elements are closed immediately, unmatched end tag closes all open elements,
+    whitespace-only strings are collapsed and comments are not a text.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack: List[str] = []
+        self.data: List[str] = []
+        self.preserve_whitespace = 0
+        self.closed_empty_elements: List[str] = []
+        self.blocks = {name: _Block() for name in BLOCKS}
+
+    def get_blocks(self) -> Dict[str, Optional[str]]:
+        return {
+            name: ''.join(block.chunks) if block.chunks is not None else None
+            for name, block in self.blocks.items()
+        }
+
+    def close(self):
+        super().close()
+        self.flush()
+
+    def flush(self, text: bool = True):
+        if not self.data:
+            return
+
+        data = ''.join(self.data)
+        self.data = []
+        if not self.preserve_whitespace and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+
+        if not text:
+            return
+
+        for block in self.blocks.values():
+            if block.text is not None and block.skip is None:
+                block.chunks.append(data)
+
+    def push(self, tag: str, attrs) -> None:
+        self.flush()
+        self.stack.append(tag)
+        index = len(self.stack) - 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace += 1
+
+        if tag == 'br':
+            for block in self.blocks.values():
+                if block.text is not None and block.skip is None:
+                    block.chunks.append('\n')
+                    block.skip = index
+            return
+
+        if tag != 'div':
+            return
+
+        classes = []
+        for key, value in attrs:
+            if key == 'class':
+                classes = (value or '').split()
+
+        if not classes:
+            return
+
+        # blocks are searched one after another and every found block has its
+        # <br> replaced, so later blocks don't see elements inside those <br>
+        hidden = False
+        for name, block in self.blocks.items():
+            if block.done or hidden:
+                pass
+            elif block.block is not None and block.text is None and 'text' in classes:
+                block.text = index
+                block.chunks = []
+            elif block.block is None and name in classes:
+                block.block = index
+            hidden = hidden or block.skip is not None
+
+    def pop(self, tag: str) -> None:
+        self.flush()
+        if tag not in self.stack:
+            # BeautifulSoup closes all open elements on unmatched end tag
+            while self.stack:
+                self.pop_one()
+            return
+
+        while self.stack and self.pop_one() != tag:
+            pass
+
+    def pop_one(self) -> str:
+        index = len(self.stack) - 1
+        tag = self.stack.pop()
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace -= 1
+
+        for block in self.blocks.values():
+            if block.skip == index:
+                block.skip = None
+            if block.text == index or block.block == index:
+                block.block = block.text = None
+                block.done = True
+        return tag
+
+    def handle_startendtag(self, tag, attrs):
+        self.push(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_starttag(self, tag, attrs):
+        self.push(tag, attrs)
+        if tag in EMPTY_ELEMENT_TAGS:
+            self.pop(tag)
+            self.closed_empty_elements.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_empty_elements:
+            self.closed_empty_elements.remove(tag)
+        else:
+            self.pop(tag)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith(('x', 'X')):
+            codepoint = int(name.lstrip('xX'), 16)
+        else:
+            codepoint = int(name)
+
+        data = None
+        if codepoint < 256:
+            # numeric references are often given in windows-1252
+            try:
+                data = bytes([codepoint]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_entityref(self, name):
+        self.handle_data(ENTITIES.get(name, f'&{name}'))
+
+    def handle_comment(self, data):
+        self.flush()
+        self.handle_data(data)
+        self.flush(text=False)
+
+    def handle_decl(self, data):
+        self.flush()
+        self.handle_data(data)
+        self.flush(text=False)
+
+    def handle_pi(self, data):
+        self.flush()
+        self.handle_data(data)
+        self.flush(text=False)
+
+    def unknown_decl(self, data):
+        self.flush()
+        if data.upper().startswith('CDATA['):
+            self.handle_data(data[len('CDATA['):])
+            self.flush()
+        else:
+            self.handle_data(data)
+            self.flush(text=False)
+
+    def error(self, message):
+        pass
+
+
+def get_blocks(html: str) -> Dict[str, Optional[str]]:
+    """ Get cleaned markdown text of every description block, None for missing blocks """
+    parser = BlocksParser()
+    parser.feed(html)
+    parser.close()
+    return {
+        name: clean_block_text(text) if text is not None else None
+        for name, text in parser.get_blocks().items()
+    }
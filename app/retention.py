@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+import sqlalchemy as sa
+
+from app import app, db
+from app.models import Vacancy, VacancyParameters, VacancyChat, Stat, PostChat, Post, utc_now
+from app.parser import KNOWN_VACANCIES
+
+
+def get_batches(table: sa.Table, condition) -> Iterator[List[int]]:
+    """
+    Ids of rows matching the condition by keyset-paginated batches, so every
+    batch starts from the last deleted id instead of scanning deleted rows again
+    """
+    size = app.config['RETENTION_BATCH_SIZE']
+    last_id = 0
+    while True:
+        statement = (
+            sa.select([table.c.id])
+            .where(condition)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(size)
+        )
+        ids = [row.id for row in db.session.execute(statement)]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def delete_rows(table: sa.Table, condition) -> int:
+    """ Delete rows matching the condition, every batch is deleted in its own short transaction """
+    count = 0
+    for ids in get_batches(table, condition):
+        count += db.session.execute(table.delete().where(table.c.id.in_(ids))).rowcount
+        db.session.commit()
+    return count
+
+
+def delete_vacancies(before: datetime) -> int:
+    """
+    Delete vacancies published before the given date together with their
+    parameters and rows of chats. Publication date is used instead of the date
+    of creation, so vacancy that is still listed in feeds and stored again
+    after deletion is deleted again instead of being kept as a new one
+    """
+    vacancy = Vacancy.__table__
+    vacancy_chat = VacancyChat.__table__
+    parameters = VacancyParameters.__table__
+
+    count = 0
+    for ids in get_batches(vacancy, vacancy.c.date < before):
+        db.session.execute(vacancy_chat.delete().where(vacancy_chat.c.vacancy_id.in_(ids)))
+        db.session.execute(parameters.delete().where(parameters.c.vacancy_id.in_(ids)))
+        count += db.session.execute(vacancy.delete().where(vacancy.c.id.in_(ids))).rowcount
+        db.session.commit()
+    return count
+
+
+def delete_old_rows():
+    """
+    Delete rows that are older than retention horizons (in days) by small
+    batches, so tables don't grow without bound and locks are held shortly.
+    Zero horizon keeps rows of the table forever
+    """
+    now = utc_now()
+
+    days = app.config['RETENTION_VACANCY_CHAT_DAYS']
+    if days:
+        table = VacancyChat.__table__
+        count = delete_rows(table, table.c.date_created < now - timedelta(days=days))
+        app.logger.info(f'Deleted {count} old vacancy chats')
+
+    days = app.config['RETENTION_VACANCY_DAYS']
+    if days:
+        count = delete_vacancies(before=now - timedelta(days=days))
+        # cached ids of deleted vacancies must not be used for new parameters.
+        # Cache is cleared on every run, since vacancies can be deleted by the
+        # run of another process
+        KNOWN_VACANCIES.clear()
+        app.logger.info(f'Deleted {count} old vacancies')
+
+    days = app.config['RETENTION_POST_CHAT_DAYS']
+    if days:
+        table = PostChat.__table__
+        sent_posts = sa.select([Post.id]).where(Post.date_sent.isnot(None))
+        condition = sa.and_(table.c.date_created < now - timedelta(days=days), table.c.post_id.in_(sent_posts))
+        count = delete_rows(table, condition)
+        app.logger.info(f'Deleted {count} old post chats')
+
+    days = app.config['RETENTION_STAT_DAYS']
+    if days:
+        table = Stat.__table__
+        count = delete_rows(table, table.c.date < now - timedelta(days=days))
+        app.logger.info(f'Deleted {count} old stats')
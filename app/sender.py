@@ -1,87 +1,362 @@
-from datetime import timedelta
-from typing import List
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, List, Iterable, Iterator, Tuple
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 
 from app import db, app, bot
-from app.models import Subscription, Vacancy, VacancyParameters, VacancyChat, utc_now
-from app.utils import chunks
+from app.contants import DIGEST_HEADER
+from app.delivery import Delivery, Result, deliver
+from app.models import Subscription, Vacancy, VacancyParameters, VacancyChat, DeliveryStatus, UserChat, Post, PostChat, \
+    utc_now
+from app.parser import MESSAGE_LIMIT, remove_markdown_symbols
+from app.utils import expire_chat_profile
 
 
-def send_vacancy_to_chat(chat: VacancyChat, vacancy: Vacancy):
+def get_delivery(chats: List[VacancyChat], text: str) -> Delivery:
+    """ Message with one or several vacancies for the chat, key is ids of its rows """
+    chat_id = chats[0].chat_id
+    return Delivery(
+        key=tuple(chat.id for chat in chats),
+        chat_id=chat_id,
+        send=partial(bot.send_message, chat_id=chat_id, text=text, parse_mode='Markdown'),
+    )
+
+
+def pack_digest(vacancies: List[Tuple[VacancyChat, Vacancy]]) -> List[Tuple[List[VacancyChat], str]]:
+    """
+    Pack vacancies of one chat to as few messages as possible with titles and
+    links, message with a single vacancy is sent with its full text
+    """
+    messages = []
+    for chat, vacancy in vacancies:
+        line = f'• [{remove_markdown_symbols(vacancy.title)}]({vacancy.url})\n'
+        if not messages or len(messages[-1][2]) + len(line) > MESSAGE_LIMIT:
+            messages.append(([], [], DIGEST_HEADER))
+        chats, items, text = messages[-1]
+        chats.append(chat)
+        items.append(vacancy)
+        messages[-1] = (chats, items, text + line)
+
+    return [
+        (chats, text if len(items) > 1 else items[0].text)
+        for chats, items, text in messages
+    ]
+
+
+def get_deliveries(vacancies: Iterable[Tuple[VacancyChat, Vacancy]]) -> List[Delivery]:
+    """ Messages for vacancies, vacancies of digest chats are packed together """
+    chats = OrderedDict()
+    for chat, vacancy in vacancies:
+        chats.setdefault(chat.chat_id, []).append((chat, vacancy))
+
+    digest_chats = {
+        chat_id for chat_id, in
+        db.session.query(UserChat.id).filter(UserChat.id.in_(list(chats)), UserChat.digest.is_(True))
+    } if chats else set()
+
+    deliveries = []
+    for chat_id, items in chats.items():
+        if chat_id in digest_chats:
+            deliveries.extend(get_delivery(rows, text) for rows, text in pack_digest(items))
+        else:
+            deliveries.extend(get_delivery([chat], vacancy.text) for chat, vacancy in items)
+    return deliveries
+
+
+def get_retry_delay(attempt: int) -> timedelta:
+    """ Exponential delay before the next attempt of sending """
+    seconds = app.config['SEND_BACKOFF'] * 2 ** attempt
+    return timedelta(seconds=min(seconds, app.config['SEND_MAX_BACKOFF']))
+
+
+def get_status(result: Result, row_id: int, attempt: int) -> DeliveryStatus:
+    """ Status of row after sending, `attempt` is number of previous failed attempts """
+    now = utc_now()
+    if result.is_sent:
+        return DeliveryStatus(id=row_id, date_sent=now)
+
+    # row is moved to the new chat and sent again right away
+    if result.new_chat_id is not None:
+        return DeliveryStatus(id=row_id, next_attempt_at=now)
+
+    if result.is_permanent_error or attempt + 1 >= app.config['SEND_MAX_ATTEMPTS']:
+        app.logger.error(f'Vacancy is not sent to chat {result.chat_id}, give up: {result.error}')
+        return DeliveryStatus(id=row_id, date_failed=now)
+
+    app.logger.warning(f'Vacancy is not sent to chat {result.chat_id}, retry later: {result.error}')
+    return DeliveryStatus(id=row_id, next_attempt_at=now + get_retry_delay(attempt))
+
+
+def update_chats(results: Iterable[Result]) -> None:
+    """
+    Deactivate chats that are not available anymore and move migrated
+    group chats to supergroups. Transaction is not committed here
+    """
+    for result in results:
+        if result.new_chat_id is not None:
+            app.logger.info(f'Chat {result.chat_id} is migrated to {result.new_chat_id}')
+            UserChat.migrate(result.chat_id, result.new_chat_id)
+            expire_chat_profile(result.chat_id)
+        elif result.is_chat_unavailable:
+            app.logger.info(f'Chat {result.chat_id} is not available, deactivate it')
+            UserChat.deactivate(result.chat_id)
+            expire_chat_profile(result.chat_id)
+
+
+class StatusWriter:
+    """
+    Collects results of sending and saves them to database in batches, every
+    `SEND_FLUSH_SIZE` results or `SEND_FLUSH_INTERVAL` seconds. Row is marked
+    as sent only after flush, so on crash not flushed messages are sent again
+    """
+
+    def __init__(self, attempts: Dict[int, int]):
+        # number of previous attempts of rows
+        self.attempts = attempts
+        self.statuses = []
+        self.errors = []
+        self.flushed = time.monotonic()
+
+    def add(self, result: Result) -> None:
+        for row_id in result.key:
+            self.statuses.append(get_status(result, row_id, self.attempts.get(row_id, 0)))
+        if not result.is_sent:
+            self.errors.append(result)
+
+        size = app.config['SEND_FLUSH_SIZE']
+        interval = app.config['SEND_FLUSH_INTERVAL']
+        if len(self.statuses) >= size or time.monotonic() - self.flushed >= interval:
+            self.flush()
+
+    def flush(self) -> None:
+        VacancyChat.bulk_update_status(self.statuses)
+        update_chats(self.errors)
+        db.session.commit()
+        self.statuses = []
+        self.errors = []
+        self.flushed = time.monotonic()
+
+
+def send_vacancies_to_chats(vacancies: Iterable[Tuple[VacancyChat, Vacancy]]) -> None:
+    """
+    Send vacancies concurrently within rate limits, statuses are saved from the
+    current thread. Only texts of messages are kept while sending, so rows can
+    be released by the session as soon as messages are built
+    """
+    attempts = {}
+
+    def collect_attempts():
+        for chat, vacancy in vacancies:
+            attempts[chat.id] = chat.attempt
+            yield chat, vacancy
+
+    deliveries = get_deliveries(collect_attempts())
+
+    writer = StatusWriter(attempts)
     try:
-        bot.send_message(
-            chat_id=chat.chat_id,
-            text=vacancy.text,
-            parse_mode='Markdown',
-        )
-        chat.date_sent = utc_now()
-    except Exception as exception:
-        chat.attempt += 1
-        app.logger.exception(
-            msg='Error on sending vacancy',
-            exc_info=exception,
-        )
+        for result in deliver(deliveries):
+            writer.add(result)
+    finally:
+        writer.flush()
 
-    db.session.commit()
+
+def get_dispatch_batches(since: datetime) -> Iterator[List[int]]:
+    """
+    Ids of vacancies created and published after the given date by
+    keyset-paginated batches. Old vacancy that is stored again after deletion
+    by retention is not sent to chats second time
+    """
+    size = app.config['DISPATCH_BATCH_SIZE']
+    last_id = 0
+    while True:
+        ids = [
+            vacancy_id for vacancy_id, in
+            db.session.query(Vacancy.id)
+            .filter(Vacancy.date_created > since, Vacancy.date > since, Vacancy.id > last_id)
+            .order_by(Vacancy.id)
+            .limit(size)
+        ]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
 
 
 def dispatch_vacancies():
+    """
+    Add unsent vacancies of the last day for every active subscribed chat with
+    INSERT ... SELECT statement for every batch of vacancies, existing rows are
+    skipped by unique constraint. Batches keep transactions short, so sending
+    can start before the whole backlog is dispatched
+    """
     day_ago = utc_now() - timedelta(days=1)
+    table = VacancyChat.__table__
 
-    # get unsent vacancies
-    vacancies = (
-        db.session.query(Vacancy, Subscription)
-        .join(VacancyParameters, Vacancy.id == VacancyParameters.vacancy_id)
-        .join(
-            Subscription,
-            sa.and_(
-                Subscription.city_id == VacancyParameters.city_id,
-                Subscription.position_id == VacancyParameters.position_id,
-            ),
-        )
-        .outerjoin(
-            VacancyChat,
-            sa.and_(
-                VacancyChat.chat_id == Subscription.chat_id,
-                VacancyChat.vacancy_id == Vacancy.id
+    count = 0
+    for vacancy_ids in get_dispatch_batches(since=day_ago):
+        matches = (
+            sa.select([
+                Subscription.chat_id,
+                Vacancy.id,
+                sa.literal(0),
+                sa.literal(utc_now()),
+            ])
+            .select_from(
+                sa.join(Vacancy, VacancyParameters, Vacancy.id == VacancyParameters.vacancy_id)
+                .join(
+                    Subscription,
+                    sa.and_(
+                        Subscription.city_id == VacancyParameters.city_id,
+                        Subscription.position_id == VacancyParameters.position_id,
+                    ),
+                )
+                .join(UserChat, UserChat.id == Subscription.chat_id)
             )
+            .where(Vacancy.id.in_(vacancy_ids))
+            .where(UserChat.is_active.is_(True))
+            .distinct()
         )
-        .filter(
-            VacancyChat.id.is_(None),
-            Vacancy.date_created > day_ago,
+        statement = (
+            postgresql.insert(table)
+            .from_select(['chat_id', 'vacancy_id', 'attempt', 'date_created'], matches)
+            .on_conflict_do_nothing(constraint='unique_vacancy_chat')
         )
-        .all()
+        result = db.session.execute(statement)
+        db.session.commit()
+        count += result.rowcount
+
+    app.logger.info(f'Dispatched {count} vacancies')
+
+
+def get_claimed_vacancies(ids: List[int]) -> Iterator[Tuple[VacancyChat, Vacancy]]:
+    """ Claimed rows with their vacancies, rows are streamed from server-side cursor """
+    return iter(
+        db.session.query(VacancyChat, Vacancy).join(Vacancy)
+        .filter(VacancyChat.id.in_(ids))
+        .order_by(VacancyChat.id)
+        .yield_per(app.config['SEND_FETCH_SIZE'])
     )
-    for chunk in chunks(vacancies, n=10):
-        for vacancy, subscription in chunk:
-            chat = VacancyChat(
-                chat_id=subscription.chat_id,
-                vacancy_id=vacancy.id,
-                attempt=0,
-            )
-            chat.soft_add()
 
 
 def broadcast_vacancies():
-    vacancies = (
-        db.session.query(VacancyChat, Vacancy).join(Vacancy)
-        .filter(
-            VacancyChat.date_sent.is_(None),
-            VacancyChat.attempt < 10000,
-        )
+    """
+    Send unsent vacancies by batches, every batch is claimed by the current
+    worker, so it's safe to run broadcasting from several processes. Failed
+    messages are retried with exponential backoff, see `get_status`.
+    Objects of sent batch are removed from the session, so memory usage
+    doesn't depend on size of the backlog
+    """
+    lease = timedelta(seconds=app.config['SEND_LEASE'])
+    while True:
+        ids = VacancyChat.claim(limit=app.config['SEND_BATCH_SIZE'], lease=lease)
+        db.session.commit()
+        if not ids:
+            return
+        send_vacancies_to_chats(get_claimed_vacancies(ids))
+        db.session.expunge_all()
+
+
+def send_vacancies(vacancies: List[Vacancy], chat_id: int):
+    """ Send vacancies to the chat right away, vacancies that are already sent or claimed are skipped """
+    if not vacancies:
+        return
+
+    vacancy_ids = [vacancy.id for vacancy in vacancies]
+    VacancyChat.bulk_add(chat_id, vacancy_ids)
+    ids = VacancyChat.claim(
+        limit=len(vacancy_ids),
+        lease=timedelta(seconds=app.config['SEND_LEASE']),
+        chat_id=chat_id,
+        vacancy_ids=vacancy_ids,
     )
-    for chat, vacancy in vacancies:
-        send_vacancy_to_chat(chat, vacancy)
+    db.session.commit()
 
+    order = {vacancy_id: index for index, vacancy_id in enumerate(vacancy_ids)}
+    claimed = sorted(get_claimed_vacancies(ids), key=lambda item: order[item[1].id])
+    send_vacancies_to_chats(claimed)
 
-def send_vacancies(vacancies: List[Vacancy], chat_id: str):
-    for vacancy in vacancies:
-        chat = VacancyChat(
-            chat_id=chat_id,
-            vacancy_id=vacancy.id,
-            attempt=0,
+
+def enqueue_post(post: Post) -> None:
+    """ Add recipients of the post: active chats subscribed to post city and position """
+    recipients = (
+        sa.select([sa.literal(post.id), Subscription.chat_id, sa.literal(utc_now())])
+        .select_from(sa.join(Subscription, UserChat, UserChat.id == Subscription.chat_id))
+        .where(UserChat.is_active.is_(True))
+        .distinct()
+    )
+    if post.city_id is not None:
+        recipients = recipients.where(Subscription.city_id == post.city_id)
+    if post.position_id is not None:
+        recipients = recipients.where(Subscription.position_id == post.position_id)
+
+    statement = (
+        postgresql.insert(PostChat.__table__)
+        .from_select(['post_id', 'chat_id', 'date_created'], recipients)
+        .on_conflict_do_nothing(constraint='unique_post_chat')
+    )
+    db.session.execute(statement)
+
+
+def get_post_delivery(post: Post, row: PostChat) -> Delivery:
+    if post.image_id:
+        send = partial(
+            bot.send_photo,
+            chat_id=row.chat_id,
+            photo=post.image_id,
+            caption=post.text,
+            parse_mode='Markdown',
+            disable_web_page_preview=False,
+        )
+    else:
+        send = partial(
+            bot.send_message,
+            chat_id=row.chat_id,
+            text=post.text,
+            parse_mode='Markdown',
+            disable_web_page_preview=False,
         )
-        chat = chat.soft_add()
-        send_vacancy_to_chat(chat, vacancy)
+    return Delivery(key=row.id, chat_id=row.chat_id, send=send)
 
+
+def send_post_batch(post: Post) -> bool:
+    """
+    Send post to the next batch of recipients and save their progress, so
+    sending can be resumed after restart. Returns True when post is sent to
+    all recipients. Chats of migrated groups get the post on the next batch
+    """
+    limit = app.config['SEND_BATCH_SIZE']
+    rows = (
+        PostChat.query
+        .filter(
+            PostChat.post_id == post.id,
+            PostChat.date_sent.is_(None),
+            PostChat.date_failed.is_(None),
+        )
+        .order_by(PostChat.id)
+        .limit(limit)
+        .all()
+    )
+
+    sent, failed, errors = [], [], []
+    for result in deliver([get_post_delivery(post, row) for row in rows]):
+        if result.is_sent:
+            sent.append(result.key)
+            continue
+        errors.append(result)
+        if result.new_chat_id is None:
+            app.logger.error(f'Post is not sent to chat {result.chat_id}: {result.error}')
+            failed.append(result.key)
+    is_migrated = len(sent) + len(failed) < len(rows)
+
+    now = utc_now()
+    if sent:
+        PostChat.query.filter(PostChat.id.in_(sent)).update({'date_sent': now}, synchronize_session=False)
+    if failed:
+        PostChat.query.filter(PostChat.id.in_(failed)).update({'date_failed': now}, synchronize_session=False)
+    update_chats(errors)
+    db.session.commit()
+    return len(rows) < limit and not is_migrated
@@ -1,22 +1,79 @@
-from typing import Callable, List, Optional, Union, Type
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Union, Type, Hashable, Any, Dict, NamedTuple, Sequence
 
-from sqlalchemy.orm import Query
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, object_session
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, ReplyKeyboardMarkup, \
     KeyboardButton, PhotoSize
-from telegram.ext import Handler, MessageHandler, Filters
+from telegram.ext import Handler, MessageHandler, Filters, CallbackContext
 
+from app import app, db
 from app.contants import PAGINATION_SIZE
 from app.enum import Menu
-from app.models import City, Position, UserChat
+from app.models import City, Position, UserChat, Greeting
 
 
-def get_pagination_keyboard(query: Query, prefix: str, offset: int = 0) -> InlineKeyboardMarkup:
+class LRUCache:
     """
-    Function selects object from model with offset AND PAGINATION_SIZE and then build list of object
+    Thread-safe mapping that keeps only `size` recently used items, items
+    expire after `ttl` seconds when it's given
+    """
+
+    def __init__(self, size: int, ttl: Optional[float] = None):
+        self.size = size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return default
+            value, expires = self._items[key]
+            if expires is not None and expires <= time.monotonic():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Reference(NamedTuple):
+    """ Cached row of reference table: city or position """
+
+    id: int
+    name: str
+    param: str
+
+
+def get_pagination_keyboard(items: Sequence[Reference], prefix: str, offset: int = 0) -> InlineKeyboardMarkup:
+    """
+    Function selects object from list with offset AND PAGINATION_SIZE and then build list of object
     with pagination  buttons, for ability to navigate between pages
 
     """
-    items = query.limit(PAGINATION_SIZE + 1).offset(offset).all()
+    items = items[offset:offset + PAGINATION_SIZE + 1]
     keyboards = [
         [InlineKeyboardButton(item.name, callback_data=f'{prefix}.{item.id}')]
         for item in items[:PAGINATION_SIZE]
@@ -39,12 +96,69 @@ def get_pagination_keyboard(query: Query, prefix: str, offset: int = 0) -> Inlin
     return InlineKeyboardMarkup(keyboards, resize_keyborad=True)
 
 
+class ReferenceCache:
+    """
+    Rows of small static table (cities or positions) loaded once, with pages
+    of inline keyboard built once for every prefix and offset. Cache is
+    invalidated when rows of the table are changed by this process
+    """
+
+    def __init__(self, model: Type[db.Model], pages: int = 1000):
+        self.model = model
+        self._items: Optional[List[Reference]] = None
+        self._by_id: Dict[int, Reference] = {}
+        self._pages = LRUCache(size=pages)
+        self._lock = threading.Lock()
+        for event in ('after_insert', 'after_update', 'after_delete'):
+            sa.event.listen(model, event, lambda *args: self.invalidate())
+
+    def load(self) -> List[Reference]:
+        items = [
+            Reference(id=row.id, name=row.name, param=row.param)
+            for row in db.session.query(self.model.id, self.model.name, self.model.param).order_by(self.model.id)
+        ]
+        with self._lock:
+            self._items = items
+            self._by_id = {item.id: item for item in items}
+            self._pages.clear()
+        return items
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._items = None
+            self._by_id = {}
+            self._pages.clear()
+
+    def get_items(self) -> List[Reference]:
+        items = self._items
+        return items if items is not None else self.load()
+
+    def get(self, item_id: Union[int, str, None]) -> Optional[Reference]:
+        if item_id is None:
+            return None
+        if self._items is None:
+            self.load()
+        return self._by_id.get(int(item_id))
+
+    def get_page(self, prefix: str, offset: int = 0) -> InlineKeyboardMarkup:
+        key = (prefix, offset)
+        markup = self._pages.get(key)
+        if markup is None:
+            markup = get_pagination_keyboard(self.get_items(), prefix=prefix, offset=offset)
+            self._pages.set(key, markup)
+        return markup
+
+
+CITIES = ReferenceCache(City)
+POSITIONS = ReferenceCache(Position)
+
+
 def get_cities_keyboard(offset: int = 0, prefix: str = 'city') -> InlineKeyboardMarkup:
-    return get_pagination_keyboard(query=City.query, prefix=prefix, offset=offset)
+    return CITIES.get_page(prefix=prefix, offset=offset)
 
 
 def get_positions_keyboard(offset: int = 0, prefix='position') -> InlineKeyboardMarkup:
-    return get_pagination_keyboard(query=Position.query, prefix=prefix, offset=offset)
+    return POSITIONS.get_page(prefix=prefix, offset=offset)
 
 
 def update_list_page(
@@ -84,14 +198,91 @@ def chunks(l, n):
         yield l[i:i + n]
 
 
+class ChatProfile(NamedTuple):
+    """ Cached flags of user chat, that are checked on every update """
+
+    id: int
+    is_admin: bool
+    is_active: bool
+    user_name: Optional[str]
+
+
+CHAT_PROFILES = LRUCache(size=app.config['CHAT_CACHE_SIZE'], ttl=app.config['CHAT_CACHE_TTL'])
+GREETING = LRUCache(size=1, ttl=app.config['CHAT_CACHE_TTL'])
+# keys of session info with cached rows that are changed in the transaction
+EXPIRED_CHATS = 'expired_chats'
+EXPIRED_GREETING = 'expired_greeting'
+
+
+def get_chat_profile(chat_id: int) -> Optional[ChatProfile]:
+    profile = CHAT_PROFILES.get(chat_id)
+    if profile is None:
+        chat = UserChat.query.get(chat_id)
+        if chat is None:
+            return None
+        profile = ChatProfile(id=chat.id, is_admin=chat.is_admin, is_active=chat.is_active, user_name=chat.user_name)
+        CHAT_PROFILES.set(chat_id, profile)
+    return profile
+
+
+def expire_chat_profile(chat_id: int, session: Optional[Session] = None) -> None:
+    """
+    Drop cached profile of the chat after commit of the session. Deleting it
+    right away lets another thread cache the row that is not committed yet
+    """
+    session = session or db.session()
+    session.info.setdefault(EXPIRED_CHATS, set()).add(chat_id)
+
+
+def invalidate_chat_profile(mapper, connection, chat: UserChat) -> None:
+    expire_chat_profile(chat.id, object_session(chat))
+
+
+def get_greeting_text() -> Optional[str]:
+    """ Text of greeting, None when it's not set """
+    text = GREETING.get('text', default=...)
+    if text is ...:
+        greeting = Greeting.query.get(1)
+        text = greeting.text if greeting else None
+        GREETING.set('text', text)
+    return text
+
+
+def invalidate_greeting(mapper, connection, greeting: Greeting) -> None:
+    object_session(greeting).info[EXPIRED_GREETING] = True
+
+
+def clear_expired(session: Session) -> None:
+    """ Changes are committed, so cached rows that were changed by the session are dropped """
+    for chat_id in session.info.pop(EXPIRED_CHATS, ()):
+        CHAT_PROFILES.delete(chat_id)
+    if session.info.pop(EXPIRED_GREETING, False):
+        GREETING.clear()
+
+
+def forget_expired(session: Session) -> None:
+    """ Changes are rolled back, so cached rows are still valid """
+    session.info.pop(EXPIRED_CHATS, None)
+    session.info.pop(EXPIRED_GREETING, None)
+
+
+# bulk updates and raw statements bypass these events, see `sender.update_chats`
+for event in ('after_insert', 'after_update', 'after_delete'):
+    sa.event.listen(UserChat, event, invalidate_chat_profile)
+    sa.event.listen(Greeting, event, invalidate_greeting)
+sa.event.listen(db.session, 'after_commit', clear_expired)
+sa.event.listen(db.session, 'after_rollback', forget_expired)
+
+
 def get_keyboard_menu(update: Update):
     message = update.message or update.callback_query.message
-    chat = UserChat.query.get(message.chat_id)
+    chat = get_chat_profile(message.chat_id)
     custom_keyboard = [
         [KeyboardButton(text=Menu.add.value), KeyboardButton(text=Menu.list.value)],
         [KeyboardButton(text=Menu.unsubscribe.value), KeyboardButton(text=Menu.help.value)],
+        [KeyboardButton(text=Menu.digest.value)],
     ]
-    if chat.is_admin:
+    if chat and chat.is_admin:
         custom_keyboard.extend([
             [KeyboardButton(text=Menu.stat.value), KeyboardButton(text=Menu.greeting.value)],
             [KeyboardButton(text=Menu.post.value)],
@@ -139,3 +330,29 @@ class MenuStringHandler(MessageHandler):
             pass_user_data=pass_user_data,
             pass_chat_data=pass_chat_data
         )
+
+
+def remove_session(update: Update, context: CallbackContext):
+    """
+    Handler of the last group: session of the dispatcher thread is removed after
+    every update, so objects and transaction don't leak into the next update
+    """
+    db.session.remove()
+
+
+def handle_error(update: Update, context: CallbackContext):
+    """ Handlers of the next groups are still called after error, so session is removed by `remove_session` """
+    app.logger.error(f'Update {update} caused error', exc_info=context.error)
+
+
+def with_session(func: Callable) -> Callable:
+    """ Decorator for jobs: session of the thread is removed after every run """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            db.session.remove()
+
+    return wrapper
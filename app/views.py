@@ -3,10 +3,11 @@ import csv
 import io
 from typing import Dict, List, Any
 
-from flask import make_response
+from flask import make_response, jsonify
 
 from app import app, db
 from app.models import UserChat, Subscription, City, Position, Stat
+from app.pool import TimedQueuePool
 
 DataDict = Dict[str, Any]
 
@@ -77,3 +78,11 @@ def actions():
         ]
     )
 
+
+
+@app.route('/pool', methods=['GET'])
+def pool():
+    """ Usage of database connection pool and time of waiting for connections """
+    if not isinstance(db.engine.pool, TimedQueuePool):
+        return jsonify({'status': db.engine.pool.status()})
+    return jsonify(db.engine.pool.get_stats())
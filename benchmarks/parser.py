@@ -0,0 +1,160 @@
+"""
+Offline benchmark of the feed parser on the recorded corpus.
+
+Run from the project root:
+
+    python -m benchmarks.parser                     # run benchmarks and check snapshots
+    python -m benchmarks.parser --update-snapshots  # accept current output
+    python -m benchmarks.parser --record NAME URL   # record live feed to the corpus
+
+Feeds are stored in benchmarks/data/feeds and single vacancy descriptions in
+benchmarks/data/vacancies. Snapshot contains hash of every rendered vacancy,
+so any change of parser output is reported.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# application is configured on import, so fake token is enough for benchmarks
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:BENCHMARK')
+
+import feedparser
+
+from app.fetcher import download
+from app.parser import parse_vacancies, prepare_text, escape_markdown_symbols, safe_url
+
+DATA_DIR = Path(__file__).parent / 'data'
+FEEDS_DIR = DATA_DIR / 'feeds'
+VACANCIES_DIR = DATA_DIR / 'vacancies'
+SNAPSHOTS_PATH = DATA_DIR / 'snapshots.json'
+
+
+def load_feeds() -> Dict[str, feedparser.FeedParserDict]:
+    return {path.name: feedparser.parse(path.read_bytes()) for path in sorted(FEEDS_DIR.glob('*.xml'))}
+
+
+def load_descriptions(feeds: Dict[str, feedparser.FeedParserDict]) -> Dict[str, str]:
+    descriptions = {}
+    for name, data in feeds.items():
+        for entry in data.entries:
+            descriptions[f'{name}#{entry.link}'] = entry.description
+    for path in sorted(VACANCIES_DIR.glob('*.html')):
+        descriptions[path.name] = path.read_text(encoding='utf-8')
+    return descriptions
+
+
+def render(feeds: Dict[str, feedparser.FeedParserDict], descriptions: Dict[str, str]) -> Dict[str, str]:
+    """ Output of the parser for every vacancy in the corpus """
+    result = {}
+    for name, data in feeds.items():
+        for vacancy in parse_vacancies(data.entries):
+            result[f'{name}#{vacancy.url}'] = vacancy.text
+    for name, description in descriptions.items():
+        result[f'{name}#text'] = prepare_text(description)
+    return result
+
+
+def get_snapshot(output: Dict[str, str]) -> Dict[str, str]:
+    return {key: hashlib.sha256(text.encode()).hexdigest() for key, text in sorted(output.items())}
+
+
+def check_snapshots(output: Dict[str, str]) -> bool:
+    expected = json.loads(SNAPSHOTS_PATH.read_text()) if SNAPSHOTS_PATH.exists() else {}
+    actual = get_snapshot(output)
+    changed = sorted(key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+    for key in changed:
+        print(f'snapshot mismatch: {key}')
+    return not changed
+
+
+def update_snapshots(output: Dict[str, str]) -> None:
+    SNAPSHOTS_PATH.write_text(json.dumps(get_snapshot(output), indent=2) + '\n')
+    print(f'{len(output)} snapshots were written to {SNAPSHOTS_PATH}')
+
+
+def measure(name: str, func: Callable[[], None], size: int, repeat: int) -> None:
+    """ Print best throughput of the function and its peak memory usage """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    print(f'{name:<24} {size / best:>12.1f} entries/sec {peak / 1024:>10.1f} KiB peak')
+
+
+def benchmark(feeds: Dict[str, feedparser.FeedParserDict], descriptions: Dict[str, str], repeat: int) -> None:
+    entries = sum(len(data.entries) for data in feeds.values())
+    texts: List[str] = list(render(feeds, descriptions).values())
+
+    def run_parse_vacancies():
+        for data in feeds.values():
+            for _ in parse_vacancies(data.entries):
+                pass
+
+    def run_prepare_text():
+        for description in descriptions.values():
+            prepare_text(description)
+
+    def run_escape_markdown_symbols():
+        for text in texts:
+            escape_markdown_symbols(text)
+
+    print(f'corpus: {len(feeds)} feeds, {entries} entries, {len(descriptions)} descriptions')
+    measure('parse_vacancies', run_parse_vacancies, entries, repeat)
+    measure('prepare_text', run_prepare_text, len(descriptions), repeat)
+    measure('escape_markdown_symbols', run_escape_markdown_symbols, len(texts), repeat)
+
+
+def record(name: str, url: str) -> None:
+    content = download(safe_url(url)).content
+
+    data = feedparser.parse(content)
+    if not data.entries:
+        print(f'Feed {url} has no entries, nothing is recorded')
+        sys.exit(1)
+
+    path = FEEDS_DIR / (name if name.endswith('.xml') else f'{name}.xml')
+    path.write_bytes(content)
+    print(f'{len(data.entries)} entries were recorded to {path}')
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    arguments.add_argument('--repeat', type=int, default=10)
+    arguments.add_argument('--update-snapshots', action='store_true')
+    arguments.add_argument('--record', nargs=2, metavar=('NAME', 'URL'))
+    args = arguments.parse_args()
+
+    if args.record:
+        record(*args.record)
+        return
+
+    feeds = load_feeds()
+    descriptions = load_descriptions(feeds)
+    output = render(feeds, descriptions)
+
+    if args.update_snapshots:
+        update_snapshots(output)
+        return
+
+    benchmark(feeds, descriptions, args.repeat)
+    if not check_snapshots(output):
+        sys.exit(1)
+    print('snapshots: ok')
+
+
+if __name__ == '__main__':
+    main()
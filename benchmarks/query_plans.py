@@ -0,0 +1,218 @@
+"""
+Query plan regression check of the hot queries.
+
+Run from the project root with DATABASE_URL pointing to local PostgreSQL with
+applied migrations:
+
+    python -m benchmarks.query_plans
+
+The same check is run by `tests/test_query_plans.py` when DATABASE_URL of the
+test run points to PostgreSQL.
+
+Large synthetic dataset is inserted in one transaction, hot queries of the
+application are executed with commits replaced by flushes, and `EXPLAIN` of
+every executed statement is checked for the expected indexes. The transaction
+is rolled back at the end, so existing data is not changed.
+"""
+import json
+import os
+import sys
+from datetime import timedelta
+from typing import Callable, List, Set, Tuple
+
+# application is configured on import, so fake token is enough for benchmarks
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:BENCHMARK')
+
+import sqlalchemy as sa
+
+from app import db, sender
+from app.models import Post, Vacancy, VacancyChat, utc_now
+
+CHATS = 20000
+CITIES = 30
+POSITIONS = 30
+SUBSCRIPTIONS_PER_CHAT = 3
+VACANCIES = 90000
+DAYS = 90
+# every chat has got vacancies of its subscriptions for the last days
+VACANCY_CHATS_PER_CHAT = 50
+PENDING_SHARE = 0.01
+# synthetic ids are far from ids of Telegram chats and prefilled dictionaries
+CHAT_ID_OFFSET = 9 * 10 ** 12
+ID_OFFSET = 10 ** 6
+
+SEED = [
+    f"""
+    INSERT INTO city (id, name, param)
+    SELECT {ID_OFFSET} + n, 'plan city ' || n, 'plan-city-' || n FROM generate_series(0, {CITIES - 1}) AS n
+    """,
+    f"""
+    INSERT INTO position (id, name, param)
+    SELECT {ID_OFFSET} + n, 'plan position ' || n, 'plan-position-' || n FROM generate_series(0, {POSITIONS - 1}) AS n
+    """,
+    f"""
+    INSERT INTO user_chat (id, is_admin, is_active, digest, context, date_created)
+    SELECT {CHAT_ID_OFFSET} + n, false, n % 10 != 0, false, '{{}}', now()
+    FROM generate_series(1, {CHATS}) AS n
+    """,
+    f"""
+    INSERT INTO subscription (chat_id, city_id, position_id, date_created)
+    SELECT
+        {CHAT_ID_OFFSET} + n,
+        {ID_OFFSET} + floor(random() * {CITIES}),
+        {ID_OFFSET} + floor(random() * {POSITIONS}),
+        now()
+    FROM generate_series(1, {CHATS}) AS n, generate_series(1, {SUBSCRIPTIONS_PER_CHAT}) AS k
+    ON CONFLICT DO NOTHING
+    """,
+    f"""
+    INSERT INTO vacancy (url, title, text, date, date_created)
+    SELECT
+        'https://jobs.dou.ua/plan/' || n || '/', 'Vacancy ' || n, repeat('text ', 200),
+        now() - interval '{DAYS} days' * n / {VACANCIES},
+        now() - interval '{DAYS} days' * n / {VACANCIES}
+    FROM generate_series(1, {VACANCIES}) AS n
+    """,
+    f"""
+    INSERT INTO vacancy_parameters (city_id, position_id, vacancy_id, date_created)
+    SELECT
+        {ID_OFFSET} + floor(random() * {CITIES}),
+        {ID_OFFSET} + floor(random() * {POSITIONS}),
+        vacancy.id, vacancy.date_created
+    FROM vacancy, generate_series(0, 1) AS k
+    WHERE vacancy.url LIKE 'https://jobs.dou.ua/plan/%'
+    ON CONFLICT DO NOTHING
+    """,
+    f"""
+    INSERT INTO vacancy_chat (chat_id, vacancy_id, attempt, date_created, date_sent)
+    SELECT
+        {CHAT_ID_OFFSET} + n,
+        (SELECT min(id) FROM vacancy WHERE url LIKE 'https://jobs.dou.ua/plan/%') + floor(random() * {VACANCIES}),
+        0, now(),
+        CASE WHEN random() < {PENDING_SHARE} THEN NULL ELSE now() END
+    FROM generate_series(1, {CHATS}) AS n, generate_series(1, {VACANCY_CHATS_PER_CHAT}) AS k
+    ON CONFLICT DO NOTHING
+    """,
+]
+
+TABLES = ('city', 'position', 'user_chat', 'subscription', 'vacancy', 'vacancy_parameters', 'vacancy_chat')
+
+
+def seed() -> None:
+    for statement in SEED:
+        db.session.execute(sa.text(statement))
+    for table in TABLES:
+        db.session.execute(sa.text(f'ANALYZE {table}'))
+
+
+def get_indexes(plan: dict) -> Set[str]:
+    indexes = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        indexes |= get_indexes(child)
+    return indexes
+
+
+def explain(statements: List[Tuple[str, object]]) -> Set[str]:
+    """ Indexes used by plans of the statements """
+    cursor = db.session.connection().connection.cursor()
+    indexes = set()
+    for statement, parameters in statements:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {statement}', parameters)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        indexes |= get_indexes(plan[0]['Plan'])
+    return indexes
+
+
+def capture(func: Callable[[], object]) -> List[Tuple[str, object]]:
+    """ Run function and return statements that were executed by it """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(('EXPLAIN', 'ANALYZE')):
+            statements.append((statement, parameters))
+
+    sa.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func()
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def get_post() -> Post:
+    subscription = db.session.execute(sa.text(
+        f'SELECT city_id, position_id FROM subscription WHERE chat_id > {CHAT_ID_OFFSET} LIMIT 1'
+    )).first()
+    post = Post(text='plan', city_id=subscription.city_id, position_id=subscription.position_id)
+    db.session.add(post)
+    db.session.flush()
+    return post
+
+
+def get_checks(post: Post) -> List[Tuple[str, Callable[[], object], Set[str]]]:
+    """ Name of the query, function that executes it and indexes that should be used """
+    day_ago = utc_now() - timedelta(days=1)
+    urls = [f'https://jobs.dou.ua/plan/{n}/' for n in range(1, 50)]
+    return [
+        (
+            'sender.broadcast_vacancies: claim',
+            lambda: VacancyChat.claim(limit=500, lease=timedelta(minutes=5)),
+            {'ix_vacancy_chat_pending'},
+        ),
+        (
+            'sender.dispatch_vacancies: batches',
+            lambda: next(sender.get_dispatch_batches(since=day_ago)),
+            {'ix_vacancy_date_created'},
+        ),
+        (
+            'sender.dispatch_vacancies',
+            sender.dispatch_vacancies,
+            {'ix_vacancy_parameters_vacancy_id', 'ix_subscription_city_position'},
+        ),
+        (
+            'sender.enqueue_post',
+            lambda: sender.enqueue_post(post),
+            {'ix_subscription_city_position'},
+        ),
+        (
+            'parser.store_vacancies: Vacancy.get_ids',
+            lambda: Vacancy.get_ids(urls),
+            {'unique_vacancy'},
+        ),
+    ]
+
+
+def check_plans() -> List[Tuple[str, Set[str], Set[str]]]:
+    """ Name of every checked query with expected and actually used indexes, data is rolled back """
+    results = []
+    commit = db.session.commit
+    db.session.commit = db.session.flush
+    try:
+        seed()
+        post = get_post()
+        for name, func, expected in get_checks(post):
+            results.append((name, expected, explain(capture(func))))
+    finally:
+        db.session.commit = commit
+        db.session.rollback()
+    return results
+
+
+def main():
+    failed = False
+    print('seeding...')
+    for name, expected, used in check_plans():
+        missing = expected - used
+        status = 'ok' if not missing else f'missing {", ".join(sorted(missing))}'
+        print(f'{name:<44} {status}  (used: {", ".join(sorted(used)) or "-"})')
+        failed = failed or bool(missing)
+
+    if failed:
+        sys.exit(1)
+    print('query plans: ok')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Compare vacancy text renderer with the previous BeautifulSoup implementation.
+
+Run from the project root:
+
+    python -m benchmarks.render [--repeat 20]
+
+Descriptions are taken from the feeds in benchmarks/data/feeds. The script fails
+when outputs of both implementations are not byte-identical.
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+from pathlib import Path
+
+# application is configured on import, so fake token is enough for benchmarks
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:BENCHMARK')
+
+import feedparser
+from bs4 import BeautifulSoup
+
+from app.parser import prepare_text
+from app.render import escape_markdown_symbols
+
+FEEDS_DIR = Path(__file__).parent / 'data' / 'feeds'
+
+
+def get_block_text(soup: BeautifulSoup, class_: str):
+    requirements = soup.find("div", {"class": class_})
+    if not requirements:
+        return None
+
+    raw_text = requirements.find("div", {"class": 'text'})
+    if not raw_text:
+        return None
+
+    for match in raw_text.findAll('span'):
+        match.unwrap()
+
+    for br in raw_text.find_all("br"):
+        br.replace_with("\n")
+
+    text = raw_text.get_text()
+    text = re.sub(r'[ \t]+', r' ', text)
+    text = re.sub(r'\n+', r'\n', text)
+    text = escape_markdown_symbols(text)
+    return text.strip()
+
+
+def prepare_text_soup(text: str):
+    """ Previous BeautifulSoup based implementation of `app.parser.prepare_text` """
+    soup = BeautifulSoup(text, 'html.parser')
+    requirements = get_block_text(soup, 'requirements')
+    skills = get_block_text(soup, 'additionalskils')
+    bonuses = get_block_text(soup, 'bonuses')
+    duty = get_block_text(soup, 'duty')
+    project = get_block_text(soup, 'project')
+
+    result = ''
+    if requirements:
+        result += f"*Необхідні навички*\n{requirements}\n\n"
+    if skills:
+        result += f"*Буде плюсом*\n{skills}\n\n"
+    if bonuses:
+        result += f"*Пропонуємо*\n{bonuses}\n\n"
+    if duty:
+        result += f"*Обов\'язки*\n{duty}\n\n"
+    if project:
+        result += f"*Про проект*\n{project}\n\n"
+    return result
+
+
+def load_descriptions():
+    descriptions = []
+    for path in sorted(FEEDS_DIR.glob('*.xml')):
+        data = feedparser.parse(path.read_bytes())
+        descriptions.extend(entry.description for entry in data.entries)
+    return descriptions
+
+
+def measure(func, descriptions, repeat: int) -> float:
+    """ Best time of rendering all descriptions, in seconds """
+    timer = timeit.Timer(lambda: [func(description) for description in descriptions])
+    return min(timer.repeat(repeat=repeat, number=1))
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    arguments.add_argument('--repeat', type=int, default=20)
+    args = arguments.parse_args()
+
+    descriptions = load_descriptions()
+    mismatches = [
+        description for description in descriptions
+        if prepare_text(description) != prepare_text_soup(description)
+    ]
+    if mismatches:
+        print(f'{len(mismatches)} of {len(descriptions)} descriptions are rendered differently')
+        sys.exit(1)
+
+    soup_time = measure(prepare_text_soup, descriptions, args.repeat)
+    fast_time = measure(prepare_text, descriptions, args.repeat)
+    size = len(descriptions)
+    print(f'descriptions:  {size}, outputs are identical')
+    print(f'BeautifulSoup: {soup_time * 1000 / size:8.3f} ms per description')
+    print(f'single pass:   {fast_time * 1000 / size:8.3f} ms per description')
+    print(f'speedup:       {soup_time / fast_time:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ import os
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from app import updater, bot, cron
+from app import updater, bot, cron, utils
 import logging
 
 logging.basicConfig(
@@ -20,6 +20,10 @@ def set_hook():
 
 
 if __name__ == '__main__':
+    # cities and positions are static, so they are loaded once before handling updates
+    utils.CITIES.load()
+    utils.POSITIONS.load()
+
     # Start the Bot
     updater.start_polling()
 
@@ -0,0 +1,26 @@
+"""Add last entry of the feed
+
+Revision ID: 2f8a6c3d5e71
+Revises: 7c2e1d9b4f10
+Create Date: 2026-10-18 10:41:27.203518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f8a6c3d5e71'
+down_revision = '7c2e1d9b4f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('feed', sa.Column('last_entry_date', sa.DateTime(), nullable=True))
+    op.add_column('feed', sa.Column('last_entry_url', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('feed', 'last_entry_url')
+    op.drop_column('feed', 'last_entry_date')
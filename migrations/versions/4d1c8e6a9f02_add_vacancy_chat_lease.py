@@ -0,0 +1,24 @@
+"""Add lease of vacancy chat
+
+Revision ID: 4d1c8e6a9f02
+Revises: 9b4e0f2a7c13
+Create Date: 2026-10-18 13:27:40.118352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d1c8e6a9f02'
+down_revision = '9b4e0f2a7c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('vacancy_chat', sa.Column('lease_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('vacancy_chat', 'lease_until')
@@ -0,0 +1,30 @@
+"""Use bigint for chat ids
+
+Revision ID: 6a0f3e9c2b58
+Revises: e3a7b5d0c8f4
+Create Date: 2026-10-18 15:02:44.906113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a0f3e9c2b58'
+down_revision = 'e3a7b5d0c8f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('user_chat', 'id', type_=sa.BigInteger(), existing_type=sa.Integer())
+    op.alter_column('subscription', 'chat_id', type_=sa.BigInteger(), existing_type=sa.Integer())
+    op.alter_column('vacancy_chat', 'chat_id', type_=sa.BigInteger(), existing_type=sa.Integer())
+    op.alter_column('stat', 'chat_id', type_=sa.BigInteger(), existing_type=sa.Integer())
+
+
+def downgrade():
+    op.alter_column('stat', 'chat_id', type_=sa.Integer(), existing_type=sa.BigInteger())
+    op.alter_column('vacancy_chat', 'chat_id', type_=sa.Integer(), existing_type=sa.BigInteger())
+    op.alter_column('subscription', 'chat_id', type_=sa.Integer(), existing_type=sa.BigInteger())
+    op.alter_column('user_chat', 'id', type_=sa.Integer(), existing_type=sa.BigInteger())
@@ -0,0 +1,35 @@
+"""Add feed table
+
+Revision ID: 7c2e1d9b4f10
+Revises: 503ab753bc2f
+Create Date: 2026-10-18 08:12:05.614930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e1d9b4f10'
+down_revision = '503ab753bc2f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('feed',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('url', sa.Text(), nullable=False),
+    sa.Column('etag', sa.Text(), nullable=True),
+    sa.Column('last_modified', sa.Text(), nullable=True),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=False),
+    sa.Column('date_checked', sa.DateTime(), nullable=True),
+    sa.Column('date_updated', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('url', name='unique_feed_url')
+    )
+
+
+def downgrade():
+    op.drop_table('feed')
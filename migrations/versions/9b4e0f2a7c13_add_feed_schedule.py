@@ -0,0 +1,26 @@
+"""Add polling schedule of the feed
+
+Revision ID: 9b4e0f2a7c13
+Revises: 2f8a6c3d5e71
+Create Date: 2026-10-18 12:06:53.871204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e0f2a7c13'
+down_revision = '2f8a6c3d5e71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('feed', sa.Column('new_rate', sa.Float(), server_default='0', nullable=False))
+    op.add_column('feed', sa.Column('next_poll_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('feed', 'next_poll_at')
+    op.drop_column('feed', 'new_rate')
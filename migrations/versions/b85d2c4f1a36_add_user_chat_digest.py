@@ -0,0 +1,24 @@
+"""Add digest mode of user chat
+
+Revision ID: b85d2c4f1a36
+Revises: 6a0f3e9c2b58
+Create Date: 2026-10-18 15:48:12.327590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b85d2c4f1a36'
+down_revision = '6a0f3e9c2b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user_chat', sa.Column('digest', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    op.drop_column('user_chat', 'digest')
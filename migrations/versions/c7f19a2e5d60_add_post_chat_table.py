@@ -0,0 +1,43 @@
+"""Add post chat table
+
+Revision ID: c7f19a2e5d60
+Revises: b85d2c4f1a36
+Create Date: 2026-10-18 16:34:51.702244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f19a2e5d60'
+down_revision = 'b85d2c4f1a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_chat',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=False),
+    sa.Column('date_sent', sa.DateTime(), nullable=True),
+    sa.Column('date_failed', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['chat_id'], ['user_chat.id'], ),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('post_id', 'chat_id', name='unique_post_chat')
+    )
+    op.add_column('post', sa.Column('date_published', sa.DateTime(), nullable=True))
+    op.add_column('post', sa.Column('admin_chat_id', sa.BigInteger(), nullable=True))
+    op.add_column('post', sa.Column('admin_message_id', sa.Integer(), nullable=True))
+    # posts that were sent before are not sent in background again
+    op.execute('UPDATE post SET date_published = date_sent WHERE date_sent IS NOT NULL')
+
+
+def downgrade():
+    op.drop_column('post', 'admin_message_id')
+    op.drop_column('post', 'admin_chat_id')
+    op.drop_column('post', 'date_published')
+    op.drop_table('post_chat')
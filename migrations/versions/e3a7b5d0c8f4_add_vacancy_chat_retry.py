@@ -0,0 +1,31 @@
+"""Add retry schedule and dead letter state of vacancy chat
+
+Revision ID: e3a7b5d0c8f4
+Revises: 4d1c8e6a9f02
+Create Date: 2026-10-18 14:15:09.450671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7b5d0c8f4'
+down_revision = '4d1c8e6a9f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('vacancy_chat', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+    op.add_column('vacancy_chat', sa.Column('date_failed', sa.DateTime(), nullable=True))
+    # rows that were retried many times already are not sent anymore
+    op.execute(
+        "UPDATE vacancy_chat SET date_failed = now() AT TIME ZONE 'utc' "
+        "WHERE date_sent IS NULL AND attempt >= 10"
+    )
+
+
+def downgrade():
+    op.drop_column('vacancy_chat', 'date_failed')
+    op.drop_column('vacancy_chat', 'next_attempt_at')
@@ -0,0 +1,35 @@
+"""Add indexes of hot queries
+
+Revision ID: f1d6b3a8e925
+Revises: c7f19a2e5d60
+Create Date: 2026-10-18 17:26:40.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1d6b3a8e925'
+down_revision = 'c7f19a2e5d60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_vacancy_chat_pending', 'vacancy_chat', ['id'],
+        postgresql_where=sa.text('date_sent IS NULL AND date_failed IS NULL'),
+    )
+    op.create_index('ix_vacancy_chat_vacancy_id', 'vacancy_chat', ['vacancy_id'])
+    op.create_index('ix_vacancy_date_created', 'vacancy', ['date_created'])
+    op.create_index('ix_subscription_city_position', 'subscription', ['city_id', 'position_id'])
+    op.create_index('ix_vacancy_parameters_vacancy_id', 'vacancy_parameters', ['vacancy_id'])
+
+
+def downgrade():
+    op.drop_index('ix_vacancy_parameters_vacancy_id', table_name='vacancy_parameters')
+    op.drop_index('ix_subscription_city_position', table_name='subscription')
+    op.drop_index('ix_vacancy_date_created', table_name='vacancy')
+    op.drop_index('ix_vacancy_chat_vacancy_id', table_name='vacancy_chat')
+    op.drop_index('ix_vacancy_chat_pending', table_name='vacancy_chat')
@@ -1,8 +1,16 @@
+import os
+import sys
+
 import feedparser
 
+from app.fetcher import download
 from app.parser import parse_vacancies
 
+# feed url or path to the recorded feed, e.g. benchmarks/data/feeds/python-kyiv.xml
 url = 'https://jobs.dou.ua/vacancies/feeds/?city=%D0%94%D0%BD%D1%96%D0%BF%D1%80%D0%BE&category=Product%20Manager'
-data = feedparser.parse(url)
-for vacancy in parse_vacancies(data):
+if len(sys.argv) > 1:
+    url = sys.argv[1]
+
+data = feedparser.parse(url if os.path.exists(url) else download(url).content)
+for vacancy in parse_vacancies(data.entries):
     print(vacancy)
@@ -0,0 +1,4 @@
+import os
+
+# application is configured on import, so fake token is required for tests
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:TEST')
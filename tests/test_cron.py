@@ -0,0 +1,87 @@
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+
+from app import cron, db
+from app.handlers import admin
+
+
+def test_stage_skips_run_while_previous_is_not_finished(monkeypatch):
+    monkeypatch.setattr(db.session, 'remove', lambda: None)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+
+    stage = cron.Stage('test', func)
+    stage()
+    assert started.wait(timeout=5)
+    stage()
+    release.set()
+
+    for thread in threading.enumerate():
+        if thread.name == 'test':
+            thread.join(timeout=5)
+    assert calls == [1]
+    assert not stage.lock.locked()
+
+
+def test_stage_releases_lock_after_error(monkeypatch):
+    monkeypatch.setattr(db.session, 'remove', lambda: None)
+
+    def func():
+        raise ValueError()
+
+    stage = cron.Stage('failing', func)
+    stage.lock.acquire()
+    stage.run()
+
+    assert not stage.lock.locked()
+
+
+def test_post_broadcast_is_not_started_twice(monkeypatch):
+    monkeypatch.setattr(db.session, 'remove', lambda: None)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def send_post_batch(post):
+        calls.append(post)
+        started.set()
+        release.wait(timeout=5)
+        raise ValueError()
+
+    monkeypatch.setattr(admin, 'Post', SimpleNamespace(query=SimpleNamespace(get=lambda post_id: SimpleNamespace(
+        id=post_id, is_sent=False,
+    ))))
+    monkeypatch.setattr(admin, 'send_post_batch', send_post_batch)
+
+    admin.start_broadcast(1)
+    assert started.wait(timeout=5)
+    admin.start_broadcast(1)
+    release.set()
+
+    for thread in threading.enumerate():
+        if thread.name == 'post-1':
+            thread.join(timeout=5)
+    assert len(calls) == 1
+    assert not admin.BROADCASTS
+
+
+def test_retention_first_run_is_delayed_by_config(monkeypatch):
+    jobs = {}
+
+    def run_repeating(callback, interval, first=None, name=None):
+        jobs[name] = (interval, first)
+
+    monkeypatch.setattr(cron, 'updater', SimpleNamespace(job_queue=SimpleNamespace(run_repeating=run_repeating)))
+    monkeypatch.setattr(cron, 'resume_posts', lambda: None)
+    monkeypatch.setitem(cron.app.config, 'RETENTION_DELAY', 3)
+    cron.configure_scheduler()
+
+    assert jobs['retention'] == (timedelta(minutes=cron.app.config['RETENTION_INTERVAL']), timedelta(minutes=3))
+    assert jobs['fetch'][1] is None
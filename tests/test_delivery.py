@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from telegram.error import RetryAfter, BadRequest
+
+from app import delivery
+from app.delivery import Delivery, TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setitem(delivery.app.config, 'SEND_CHAT_INTERVAL', 0.05)
+    monkeypatch.setitem(delivery.app.config, 'SEND_RETRIES', 2)
+    monkeypatch.setattr(delivery, 'BUCKET', TokenBucket(rate=1000))
+    delivery.LAST_SENT.clear()
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+
+    assert time.monotonic() - start >= 0.09
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=1000)
+    bucket.pause(0.05)
+
+    start = time.monotonic()
+    bucket.acquire()
+
+    assert time.monotonic() - start >= 0.04
+
+
+def test_deliver_keeps_order_and_spacing_of_chat_messages():
+    sent = []
+
+    def send(chat_id, number):
+        sent.append((chat_id, number, time.monotonic()))
+
+    deliveries = [
+        Delivery(key=(chat_id, number), chat_id=chat_id, send=lambda c=chat_id, n=number: send(c, n))
+        for number in range(3)
+        for chat_id in (1, 2)
+    ]
+
+    results = list(delivery.deliver(deliveries))
+
+    assert len(results) == 6
+    assert all(result.is_sent for result in results)
+    for chat_id in (1, 2):
+        chat_sent = [item for item in sent if item[0] == chat_id]
+        assert [number for _, number, _ in chat_sent] == [0, 1, 2]
+        assert all(b[2] - a[2] >= 0.04 for a, b in zip(chat_sent, chat_sent[1:]))
+
+
+def test_deliver_retries_flood_control_errors():
+    calls = []
+
+    def send():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RetryAfter(0.01)
+
+    [result] = delivery.deliver([Delivery(key=1, chat_id=1, send=send)])
+
+    assert result.is_sent
+    assert len(calls) == 2
+
+
+def test_deliver_returns_errors():
+    def send():
+        raise BadRequest('Chat not found')
+
+    def flood():
+        raise RetryAfter(0.01)
+
+    results = {
+        result.key: result
+        for result in delivery.deliver([
+            Delivery(key=1, chat_id=1, send=send),
+            Delivery(key=2, chat_id=2, send=flood),
+        ])
+    }
+
+    assert isinstance(results[1].error, BadRequest)
+    assert isinstance(results[2].error, RetryAfter)
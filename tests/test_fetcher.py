@@ -0,0 +1,118 @@
+import pytest
+import requests
+
+from app import fetcher
+
+
+class FakeResponse:
+
+    def __init__(self, status_code: int, content: bytes = b'', headers=None):
+        self.url = 'https://jobs.dou.ua/vacancies/feeds/'
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error', response=self)
+
+    def iter_content(self, size):
+        for start in range(0, len(self.content), size):
+            yield self.content[start:start + size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+
+class FakeSession:
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, headers, timeout, stream):
+        self.calls.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(fetcher.time, 'sleep', calls.append)
+    return calls
+
+
+def stub_session(monkeypatch, *responses) -> FakeSession:
+    session = FakeSession(*responses)
+    monkeypatch.setattr(fetcher, 'get_session', lambda: session)
+    return session
+
+
+def test_download_reads_content(monkeypatch, sleeps):
+    response = FakeResponse(200, b'x' * 100000, {'ETag': '"1"'})
+    stub_session(monkeypatch, response)
+
+    result = fetcher.download('https://jobs.dou.ua/vacancies/feeds/')
+
+    assert result.content == b'x' * 100000
+    assert result.headers['ETag'] == '"1"'
+    assert response.closed
+    assert sleeps == []
+
+
+def test_download_retries_server_errors_and_connection_errors(monkeypatch, sleeps):
+    session = stub_session(
+        monkeypatch,
+        FakeResponse(503),
+        requests.ConnectionError('reset'),
+        FakeResponse(200, b'feed'),
+    )
+
+    result = fetcher.download('https://jobs.dou.ua/vacancies/feeds/', {'If-None-Match': '"1"'})
+
+    assert result.content == b'feed'
+    assert len(session.calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_download_gives_up_after_retries(monkeypatch, sleeps):
+    monkeypatch.setitem(fetcher.app.config, 'FEED_RETRIES', 1)
+    stub_session(monkeypatch, requests.Timeout('read'), requests.Timeout('read'))
+
+    with pytest.raises(requests.Timeout):
+        fetcher.download('https://jobs.dou.ua/vacancies/feeds/')
+
+    assert len(sleeps) == 1
+
+
+def test_download_does_not_retry_client_errors(monkeypatch, sleeps):
+    stub_session(monkeypatch, FakeResponse(404))
+
+    with pytest.raises(requests.HTTPError):
+        fetcher.download('https://jobs.dou.ua/vacancies/feeds/')
+
+    assert sleeps == []
+
+
+def test_download_returns_not_modified_without_content(monkeypatch, sleeps):
+    stub_session(monkeypatch, FakeResponse(304))
+
+    result = fetcher.download('https://jobs.dou.ua/vacancies/feeds/')
+
+    assert result.status == 304
+    assert result.content == b''
+
+
+def test_backoff_is_bounded_by_exponential_delay(monkeypatch):
+    monkeypatch.setitem(fetcher.app.config, 'FEED_BACKOFF', 0.5)
+
+    delays = [fetcher.get_backoff(3) for _ in range(100)]
+
+    assert all(0 <= delay <= 4 for delay in delays)
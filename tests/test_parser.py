@@ -0,0 +1,183 @@
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from app import parser
+from app.models import City, Position
+from app.fetcher import Download
+
+FEED = (
+    b'<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel>'
+    b'<title>DOU</title><lastBuildDate>%s</lastBuildDate><item><title>Python Developer</title>'
+    b'<link>https://jobs.dou.ua/vacancies/1/</link></item></channel></rss>'
+)
+
+
+@pytest.fixture
+def parse_calls(monkeypatch):
+    calls = []
+    original = parser.feedparser.parse
+
+    def parse(content):
+        calls.append(content)
+        return original(content)
+
+    monkeypatch.setattr(parser.feedparser, 'parse', parse)
+    return calls
+
+
+def stub_download(monkeypatch, response):
+    calls = []
+
+    def download(url, headers=None):
+        calls.append(headers)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(parser, 'download', download)
+    return calls
+
+
+def test_fetch_feed_parses_new_content(monkeypatch, parse_calls):
+    content = FEED % b'Mon, 02 Dec 2019 18:00:00 +0200'
+    stub_download(monkeypatch, Download(status=200, content=content, headers={'ETag': '"1"'}))
+
+    response = parser.fetch_feed('https://jobs.dou.ua/vacancies/feeds/')
+
+    assert parse_calls == [content]
+    assert response.data.entries[0].title == 'Python Developer'
+    assert response.etag == '"1"'
+    assert response.content_hash == parser.get_content_hash(content)
+
+
+def test_fetch_feed_skips_parsing_on_not_modified(monkeypatch, parse_calls):
+    calls = stub_download(monkeypatch, Download(status=304, content=b'', headers={}))
+
+    response = parser.fetch_feed(
+        url='https://jobs.dou.ua/vacancies/feeds/',
+        headers={'If-None-Match': '"1"'},
+        content_hash='hash',
+    )
+
+    assert parse_calls == []
+    assert response.data is None
+    assert response.content_hash == 'hash'
+    assert calls == [{'If-None-Match': '"1"'}]
+
+
+def test_fetch_feed_skips_parsing_of_unchanged_content(monkeypatch, parse_calls):
+    previous = FEED % b'Mon, 02 Dec 2019 18:00:00 +0200'
+    content = FEED % b'Mon, 02 Dec 2019 18:05:00 +0200'
+    stub_download(monkeypatch, Download(status=200, content=content, headers={}))
+
+    response = parser.fetch_feed(
+        url='https://jobs.dou.ua/vacancies/feeds/',
+        content_hash=parser.get_content_hash(previous),
+    )
+
+    assert parse_calls == []
+    assert response.data is None
+
+
+def test_fetch_feed_raises_http_errors(monkeypatch, parse_calls):
+    stub_download(monkeypatch, requests.HTTPError('500 Server Error'))
+
+    with pytest.raises(requests.HTTPError):
+        parser.fetch_feed('https://jobs.dou.ua/vacancies/feeds/')
+
+    assert parse_calls == []
+
+
+
+
+
+def test_iter_new_entries_stops_on_last_seen_entry():
+    entries = parser.feedparser.parse(
+        b'<rss version="2.0"><channel>'
+        b'<item><link>https://jobs.dou.ua/vacancies/3/</link><pubDate>Mon, 02 Dec 2019 12:00:00 GMT</pubDate></item>'
+        b'<item><link>https://jobs.dou.ua/vacancies/2/</link><pubDate>Mon, 02 Dec 2019 11:00:00 GMT</pubDate></item>'
+        b'<item><link>https://jobs.dou.ua/vacancies/1/</link><pubDate>Mon, 02 Dec 2019 10:00:00 GMT</pubDate></item>'
+        b'</channel></rss>'
+    ).entries
+    last_date = parser.get_entry_date(entries[1])
+
+    by_url = parser.iter_new_entries(entries, None, 'https://jobs.dou.ua/vacancies/2/')
+    by_date = parser.iter_new_entries(entries, last_date, 'https://jobs.dou.ua/vacancies/0/')
+
+    assert [entry.link for entry in by_url] == ['https://jobs.dou.ua/vacancies/3/']
+    assert [entry.link for entry in by_date] == ['https://jobs.dou.ua/vacancies/3/', 'https://jobs.dou.ua/vacancies/2/']
+    assert len(list(parser.iter_new_entries(entries, None, None))) == 3
+
+
+def test_get_entry_cities_from_title():
+    kyiv = City(id=0, name='Київ', param='city=Київ')
+    remote = City(id=30, name='віддалена робота', param='remote')
+    locations = {'Київ': kyiv, 'віддалено': remote}
+
+    def entry(title):
+        return parser.feedparser.FeedParserDict(title=title)
+
+    assert parser.get_entry_cities(entry('Python Developer в Company, Київ, віддалено'), locations) == [kyiv, remote]
+    assert parser.get_entry_cities(entry('Python Developer в Company, Варшава (Польща)'), locations) == []
+    assert parser.get_entry_cities(entry('Python Developer в Company'), locations) == []
+
+
+def test_plan_feeds_coalesces_cities_with_location(monkeypatch):
+    monkeypatch.setitem(parser.app.config, 'FEED_COALESCE', True)
+    python = Position(id=1, name='Python', param='category=Python')
+    kyiv = City(id=0, name='Київ', param='city=Київ')
+    lviv = City(id=2, name='Львів', param='city=Львів')
+    relocate = City(id=31, name='за кордоном', param='relocate')
+    pairs = [(kyiv, python), (lviv, python), (relocate, python)]
+
+    plans = parser.plan_feeds(pairs, locations={'Київ': kyiv, 'Львів': lviv})
+    separate = parser.plan_feeds(pairs, locations={})
+
+    assert {url: (plan.cities, plan.coalesced) for url, plan in plans.items()} == {
+        parser.build_category_feed_url(python): ([kyiv, lviv], True),
+        parser.build_feed_url(relocate, python): ([relocate], False),
+    }
+    assert len(separate) == 3
+    assert not any(plan.coalesced for plan in separate.values())
+
+
+def test_poll_interval_depends_on_rate_and_subscribers(monkeypatch):
+    monkeypatch.setitem(parser.app.config, 'FEED_MIN_INTERVAL', 2)
+    monkeypatch.setitem(parser.app.config, 'FEED_MAX_INTERVAL', 120)
+
+    assert parser.get_poll_interval(new_rate=0, subscribers=1) == timedelta(minutes=2)
+    assert parser.get_poll_interval(new_rate=0, subscribers=1, previous=timedelta(minutes=8)) == timedelta(minutes=16)
+    assert parser.get_poll_interval(new_rate=0, subscribers=1, previous=timedelta(minutes=90)) == timedelta(minutes=120)
+    assert parser.get_poll_interval(new_rate=2, subscribers=1) == timedelta(minutes=30)
+    assert parser.get_poll_interval(new_rate=2, subscribers=4) == timedelta(minutes=10)
+    assert parser.get_poll_interval(new_rate=100, subscribers=1) == timedelta(minutes=2)
+
+
+def test_schedule_feed_averages_rate_of_new_vacancies(monkeypatch):
+    monkeypatch.setitem(parser.app.config, 'FEED_MIN_INTERVAL', 2)
+    monkeypatch.setitem(parser.app.config, 'FEED_MAX_INTERVAL', 120)
+    now = datetime(2019, 12, 2, 12, 0)
+    feed = parser.Feed(new_rate=1, date_checked=now - timedelta(hours=1))
+
+    parser.schedule_feed(feed, new_entries=11, subscribers=1, now=now)
+
+    assert feed.new_rate == pytest.approx(0.3 * 11 + 0.7 * 1)
+    assert feed.next_poll_at == now + timedelta(minutes=15)
+    assert not feed.is_due(now)
+    assert feed.is_due(now + timedelta(minutes=15))
+
+
+def test_schedule_feed_without_rate_starts_from_minimal_interval(monkeypatch):
+    monkeypatch.setitem(parser.app.config, 'FEED_MIN_INTERVAL', 2)
+    monkeypatch.setitem(parser.app.config, 'FEED_MAX_INTERVAL', 120)
+    now = datetime(2019, 12, 2, 12, 0)
+    feed = parser.Feed(new_rate=0, date_checked=now - timedelta(hours=1))
+
+    parser.schedule_feed(feed, new_entries=None, subscribers=1, now=now)
+    assert feed.next_poll_at == now + timedelta(minutes=2)
+
+    feed.date_checked = now
+    parser.schedule_feed(feed, new_entries=0, subscribers=1, now=now + timedelta(minutes=2))
+    assert feed.next_poll_at == now + timedelta(minutes=6)
@@ -0,0 +1,25 @@
+import threading
+import time
+
+import sqlalchemy as sa
+
+from app.pool import TimedQueuePool
+
+
+def test_pool_measures_waiting_for_connection():
+    engine = sa.create_engine('sqlite://', poolclass=TimedQueuePool, pool_size=1, max_overflow=0)
+    connection = engine.connect()
+
+    def release():
+        time.sleep(0.1)
+        connection.close()
+
+    thread = threading.Thread(target=release)
+    thread.start()
+    engine.connect().close()
+    thread.join()
+
+    stats = engine.pool.get_stats()
+    assert stats['checkouts'] == 2
+    assert stats['wait_max'] >= 0.05
+    assert stats['checked_out'] == 0
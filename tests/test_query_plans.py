@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+from benchmarks import query_plans
+
+pytestmark = pytest.mark.skipif(
+    not os.getenv('DATABASE_URL', '').startswith('postgres'),
+    reason='query plans are checked on PostgreSQL with applied migrations only',
+)
+
+
+def test_hot_queries_use_indexes():
+    for name, expected, used in query_plans.check_plans():
+        assert expected <= used, f'{name} uses {sorted(used)} instead of {sorted(expected)}'
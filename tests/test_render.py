@@ -0,0 +1,41 @@
+import pytest
+
+from app.render import get_blocks
+
+# expected values are produced by the previous BeautifulSoup implementation
+CASES = [
+    (
+        '<div class="requirements b-typo"><h3>Навички</h3><div class="text">'
+        '<p>• Python 3_x<br />\n• *SQL*  and\t[git]</p></div></div>',
+        {'requirements': '• Python 3\\_x\n• \\*SQL\\* and \\[git]'},
+    ),
+    (
+        '<div class="duty"><div class="text"><p><span>one</span>  <span>two</span></p>\n\n'
+        '<p>  \n  </p><!-- hidden --><p>three &amp; &nbsp;four</p></div></div>',
+        {'duty': 'one two\nthree & \xa0four'},
+    ),
+    (
+        # unmatched end tag closes all open elements
+        '<div class="project"><div class="text"><p>a</span>b</p></div></div>'
+        '<div class="bonuses"><div class="text">late</div></div>',
+        {'project': 'a', 'bonuses': 'late'},
+    ),
+    (
+        # only the first block is used
+        '<div class="bonuses"><div class="text"></div></div>'
+        '<div class="bonuses"><div class="text">second</div></div>',
+        {'bonuses': ''},
+    ),
+    (
+        '<div class="additionalskils"><div class="text"><pre>  a\n\n  </pre>&#150; &#x41;</div></div>',
+        {'additionalskils': 'a\n – A'},
+    ),
+]
+
+
+@pytest.mark.parametrize('html, expected', CASES)
+def test_get_blocks(html, expected):
+    blocks = get_blocks(html)
+
+    for name, text in blocks.items():
+        assert text == expected.get(name)
@@ -0,0 +1,147 @@
+from datetime import timedelta
+
+import pytest
+from telegram.error import BadRequest, ChatMigrated, TimedOut, Unauthorized
+
+from app import sender
+from app.delivery import Result
+
+
+@pytest.fixture
+def flushes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sender.VacancyChat, 'bulk_update_status', lambda statuses: calls.append(statuses))
+    monkeypatch.setattr(sender.db.session, 'commit', lambda: None)
+    return calls
+
+
+def test_status_writer_flushes_by_batches(monkeypatch, flushes):
+    monkeypatch.setitem(sender.app.config, 'SEND_FLUSH_SIZE', 2)
+    monkeypatch.setitem(sender.app.config, 'SEND_FLUSH_INTERVAL', 60)
+    writer = sender.StatusWriter(attempts={1: 0, 2: 0, 3: 0})
+
+    writer.add(Result(key=(1,), chat_id=1))
+    assert flushes == []
+
+    writer.add(Result(key=(2,), chat_id=1, error=ValueError()))
+    writer.add(Result(key=(3,), chat_id=2))
+    writer.flush()
+
+    assert [[status.id for status in statuses] for statuses in flushes] == [[1, 2], [3]]
+    assert flushes[0][0].date_sent is not None
+    assert flushes[0][1].date_sent is None
+
+
+def test_status_writer_flushes_by_time(monkeypatch, flushes):
+    monkeypatch.setitem(sender.app.config, 'SEND_FLUSH_SIZE', 100)
+    monkeypatch.setitem(sender.app.config, 'SEND_FLUSH_INTERVAL', 0)
+    writer = sender.StatusWriter(attempts={})
+
+    writer.add(Result(key=(1,), chat_id=1))
+
+    assert len(flushes) == 1
+
+
+@pytest.fixture
+def retries(monkeypatch):
+    monkeypatch.setitem(sender.app.config, 'SEND_MAX_ATTEMPTS', 3)
+    monkeypatch.setitem(sender.app.config, 'SEND_BACKOFF', 60)
+    monkeypatch.setitem(sender.app.config, 'SEND_MAX_BACKOFF', 200)
+
+
+def test_retry_delay_is_exponential_and_bounded(retries):
+    assert sender.get_retry_delay(0) == timedelta(seconds=60)
+    assert sender.get_retry_delay(1) == timedelta(seconds=120)
+    assert sender.get_retry_delay(2) == timedelta(seconds=200)
+
+
+def test_transient_error_is_retried_later(retries):
+    status = sender.get_status(Result(key=(1,), chat_id=1, error=TimedOut()), row_id=1, attempt=1)
+
+    assert status.date_sent is None
+    assert status.date_failed is None
+    assert status.next_attempt_at > sender.utc_now() + timedelta(seconds=100)
+
+
+@pytest.mark.parametrize('error, attempt', [
+    (Unauthorized('Forbidden: bot was blocked by the user'), 0),
+    (BadRequest('Chat not found'), 0),
+    (TimedOut(), 2),
+])
+def test_permanent_error_and_last_attempt_fail_row(retries, error, attempt):
+    status = sender.get_status(Result(key=(1,), chat_id=1, error=error), row_id=1, attempt=attempt)
+
+    assert status.date_failed is not None
+    assert status.next_attempt_at is None
+
+
+def test_migrated_chat_is_sent_again():
+    status = sender.get_status(Result(key=(1,), chat_id=1, error=ChatMigrated(-100123)), row_id=1, attempt=0)
+
+    assert status.date_failed is None
+    assert status.next_attempt_at <= sender.utc_now()
+
+
+def test_update_chats_deactivates_and_migrates_chats(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sender.UserChat, 'deactivate', lambda chat_id: calls.append(('deactivate', chat_id)))
+    monkeypatch.setattr(sender.UserChat, 'migrate', lambda chat_id, new_id: calls.append(('migrate', chat_id, new_id)))
+    expired = []
+    monkeypatch.setattr(sender, 'expire_chat_profile', expired.append)
+
+    sender.update_chats([
+        Result(key=1, chat_id=1, error=Unauthorized('Forbidden: bot was blocked by the user')),
+        Result(key=2, chat_id=2, error=BadRequest('Bad Request: chat not found')),
+        Result(key=3, chat_id=3, error=ChatMigrated(-100123)),
+        Result(key=4, chat_id=4, error=BadRequest("Can't parse entities")),
+        Result(key=5, chat_id=5, error=TimedOut()),
+    ])
+
+    assert calls == [('deactivate', 1), ('deactivate', 2), ('migrate', 3, -100123)]
+    assert expired == [1, 2, 3]
+
+
+def test_pack_digest_fits_messages_into_limit(monkeypatch):
+    monkeypatch.setattr(sender, 'MESSAGE_LIMIT', 200)
+    vacancies = [
+        (
+            sender.VacancyChat(id=index, chat_id=1),
+            sender.Vacancy(id=index, title=f'Python *Developer* {index}', url=f'https://jobs.dou.ua/{index}/', text=f'full {index}'),
+        )
+        for index in range(7)
+    ]
+
+    messages = sender.pack_digest(vacancies)
+
+    assert [[chat.id for chat in chats] for chats, _ in messages] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert all(len(text) <= 200 for _, text in messages)
+    assert messages[0][1].startswith(sender.DIGEST_HEADER)
+    assert '• [Python Developer 0](https://jobs.dou.ua/0/)' in messages[0][1]
+    assert messages[-1][1] == 'full 6'
+
+
+def test_status_writer_saves_status_of_every_digest_row(monkeypatch, flushes):
+    monkeypatch.setitem(sender.app.config, 'SEND_FLUSH_SIZE', 100)
+    monkeypatch.setitem(sender.app.config, 'SEND_FLUSH_INTERVAL', 60)
+    writer = sender.StatusWriter(attempts={1: 0, 2: 0})
+
+    writer.add(Result(key=(1, 2), chat_id=1))
+    writer.flush()
+
+    assert [status.id for status in flushes[0]] == [1, 2]
+
+
+def test_post_delivery_sends_photo_or_text(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sender.bot, 'send_photo', lambda **kwargs: calls.append(('photo', kwargs)))
+    monkeypatch.setattr(sender.bot, 'send_message', lambda **kwargs: calls.append(('text', kwargs)))
+    row = sender.PostChat(id=7, post_id=1, chat_id=42)
+
+    delivery = sender.get_post_delivery(sender.Post(id=1, text='news', image_id='photo-id'), row)
+    delivery.send()
+    delivery = sender.get_post_delivery(sender.Post(id=1, text='news'), row)
+    delivery.send()
+
+    assert delivery.key == 7 and delivery.chat_id == 42
+    assert [(kind, kwargs['chat_id']) for kind, kwargs in calls] == [('photo', 42), ('text', 42)]
+    assert calls[0][1]['caption'] == calls[1][1]['text'] == 'news'
@@ -0,0 +1,124 @@
+from queue import Queue
+from types import SimpleNamespace
+
+from telegram import Update
+from telegram.ext import Dispatcher, TypeHandler
+
+from app import utils, bot
+from app.contants import DEFAULT_GROUP, SESSION_GROUP
+from app.models import City
+from app.utils import LRUCache, Reference, ReferenceCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_clear():
+    cache = LRUCache(size=2)
+    cache.set('a', 1)
+
+    cache.clear()
+
+    assert cache.get('a', 'missing') == 'missing'
+
+
+class FakeQuery:
+    def __init__(self, rows, calls):
+        self.rows = rows
+        self.calls = calls
+
+    def order_by(self, *args):
+        self.calls.append(args)
+        return self.rows
+
+
+def test_reference_cache_builds_pages_once(monkeypatch):
+    calls = []
+    rows = [Reference(id=index, name=f'City {index}', param=f'city={index}') for index in range(1, 8)]
+    monkeypatch.setattr(utils.db.session, 'query', lambda *columns: FakeQuery(rows, calls))
+    cache = ReferenceCache(City)
+
+    first = cache.get_page(prefix='city', offset=0)
+    second = cache.get_page(prefix='city', offset=5)
+
+    assert cache.get_page(prefix='city', offset=0) is first
+    assert cache.get('7').name == 'City 7'
+    assert len(calls) == 1
+    assert [row[0].callback_data for row in first.inline_keyboard[:-1]] == [f'city.{index}' for index in range(1, 6)]
+    assert [button.callback_data for button in first.inline_keyboard[-1]] == ['city.prev.None', 'city.next.0']
+    assert [button.callback_data for button in second.inline_keyboard[-1]] == ['city.prev.5', 'city.next.None']
+
+    cache.invalidate()
+    cache.get_page(prefix='city', offset=0)
+    assert len(calls) == 2
+
+
+def test_lru_cache_expires_items(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(utils.time, 'monotonic', lambda: now[0])
+    cache = LRUCache(size=2, ttl=10)
+    cache.set('a', 1)
+
+    now[0] += 5
+    assert cache.get('a') == 1
+    now[0] += 5
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_chat_profile_is_cached_until_change_is_committed(monkeypatch):
+    calls = []
+
+    class FakeQuery:
+        @staticmethod
+        def get(chat_id):
+            calls.append(chat_id)
+            return SimpleNamespace(id=chat_id, is_admin=True, is_active=True, user_name='admin')
+
+    monkeypatch.setattr(utils, 'UserChat', SimpleNamespace(query=FakeQuery))
+    utils.CHAT_PROFILES.clear()
+
+    assert utils.get_chat_profile(1).is_admin
+    assert utils.get_chat_profile(1).user_name == 'admin'
+    assert calls == [1]
+
+    session = SimpleNamespace(info={})
+    utils.expire_chat_profile(1, session)
+    utils.get_chat_profile(1)
+    assert calls == [1]
+
+    utils.forget_expired(session)
+    utils.get_chat_profile(1)
+    assert calls == [1]
+
+    utils.expire_chat_profile(1, session)
+    utils.clear_expired(session)
+    utils.get_chat_profile(1)
+    assert calls == [1, 1]
+
+
+def test_session_is_removed_after_handler_error(monkeypatch):
+    removed = []
+    monkeypatch.setattr(utils.db.session, 'remove', lambda: removed.append(1))
+
+    def failing(update, context):
+        raise ValueError()
+
+    dispatcher = Dispatcher(bot=bot, update_queue=Queue(), workers=0, use_context=True)
+    dispatcher.add_handler(TypeHandler(Update, failing), group=DEFAULT_GROUP)
+    dispatcher.add_handler(TypeHandler(Update, utils.remove_session), group=SESSION_GROUP)
+    dispatcher.add_error_handler(utils.handle_error)
+    dispatcher.process_update(Update(update_id=1))
+
+    assert removed == [1]